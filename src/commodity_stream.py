@@ -0,0 +1,189 @@
+'''
+Streaming commodity ingestion for large demand matrices.
+
+Commodities are read one at a time from any iterable of (source, sink,
+demand) triples, or from a whitespace separated text file, and stored as
+three flat arrays of node indices and demands over a CSRGraph instead of one
+Commodity object each.  maximum_concurrent_flow works on the arrays directly;
+CommodityView gives Commodity-like access to one entry.  Reachability is
+checked with one breadth first search per distinct source; the reachable
+sets of the most recently used sources are cached, so a stream grouped or
+sorted by source does a single search per source.
+'''
+from array import array
+from collections import OrderedDict
+
+import networkx as nx
+
+
+# reachable sets kept at once; each costs one byte per node
+REACH_CACHE_SIZE = 64
+
+
+def read_commodities(path, node_type=int):
+    '''
+    Yields (source, sink, demand) from a text file with one commodity per
+    line.  Blank lines and lines starting with # are skipped; node labels
+    are converted with node_type.
+    '''
+    with open(path) as lines:
+        for line in lines:
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            source, sink, demand = fields[:3]
+            yield node_type(source), node_type(sink), float(demand)
+
+
+class CommodityView(object):
+    '''
+    Commodity-like view of one entry of a CommodityArrays, for code that
+    wants one object at a time; demand writes through to the arrays
+    '''
+    __slots__ = ('commodities', 'index')
+
+    def __init__(self, commodities, index):
+        self.commodities = commodities
+        self.index = index
+
+    @property
+    def source(self):
+        commodities = self.commodities
+        return commodities.graph.nodes[commodities.sources[self.index]]
+
+    @property
+    def sink(self):
+        commodities = self.commodities
+        return commodities.graph.nodes[commodities.sinks[self.index]]
+
+    @property
+    def demand(self):
+        return self.commodities.demands[self.index]
+
+    @demand.setter
+    def demand(self, value):
+        self.commodities.demands[self.index] = value
+
+
+class CommodityArrays(object):
+    '''
+    Commodities of a CSRGraph as parallel arrays: sources[i] and sinks[i] are
+    node indices and demands[i] the demand of the i-th commodity.
+
+    Commodities whose sink cannot be reached from their source raise
+    NetworkXUnfeasible, or are counted in skipped and dropped if
+    skip_unreachable is set.  Indexing or iterating yields CommodityView
+    objects.
+    '''
+
+    def __init__(self, graph, commodities=(), skip_unreachable=False,
+                 cache_size=REACH_CACHE_SIZE):
+        n = graph.num_nodes
+        self.graph = graph
+        self.sources = array('l')
+        self.sinks = array('l')
+        self.demands = array('d')
+        self.skip_unreachable = skip_unreachable
+        self.skipped = 0
+        self.searches = 0
+        self.cache_size = cache_size
+        self._reach = OrderedDict()  # source index -> bytearray, oldest first
+        self._queue = array('l', [0]) * n
+        self.extend(commodities)
+
+    @classmethod
+    def from_arrays(cls, graph, sources, sinks, demands):
+        '''
+        Wraps existing source, sink and demand arrays without copying or
+        checking them, e.g. views into a shared mapping (see shared_graph).
+        Such views have a fixed size, so nothing can be appended.
+        '''
+        commodities = cls(graph)
+        commodities.sources = sources
+        commodities.sinks = sinks
+        commodities.demands = demands
+        return commodities
+
+    def __len__(self):
+        return len(self.demands)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('commodity index out of range')
+        return CommodityView(self, index)
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield CommodityView(self, index)
+
+    def reachable(self, source):
+        '''
+        Returns a bytearray flagging every node reachable from node index
+        source, from the cache or from a new breadth first search
+        '''
+        cache = self._reach
+        flags = cache.pop(source, None)
+        if flags is None:
+            flags = self._search(source)
+            self.searches += 1
+            if len(cache) >= self.cache_size:
+                cache.popitem(last=False)
+        cache[source] = flags
+        return flags
+
+    def _search(self, source):
+        graph = self.graph
+        offsets, tails = graph.offsets, graph.tails
+        queue = self._queue
+        flags = bytearray(graph.num_nodes)
+        flags[source] = 1
+        queue[0] = source
+        head, tail = 0, 1
+        while head < tail:
+            u = queue[head]
+            head += 1
+            for eid in xrange(offsets[u], offsets[u + 1]):
+                v = tails[eid]
+                if not flags[v]:
+                    flags[v] = 1
+                    queue[tail] = v
+                    tail += 1
+        return flags
+
+    def append(self, source, sink, demand):
+        '''
+        Adds a commodity given by node labels.  Returns False if it was
+        skipped as unreachable.
+        '''
+        node_index = self.graph.node_index
+        u, v = node_index.get(source), node_index.get(sink)
+        if u is None or v is None or u == v or not self.reachable(u)[v]:
+            if self.skip_unreachable:
+                self.skipped += 1
+                return False
+            raise nx.NetworkXUnfeasible('no path from %s to %s' % (source, sink))
+        self.sources.append(u)
+        self.sinks.append(v)
+        self.demands.append(demand)
+        return True
+
+    def extend(self, commodities):
+        '''
+        Adds every (source, sink, demand) triple of an iterable, e.g. one
+        returned by read_commodities
+        '''
+        append = self.append
+        for source, sink, demand in commodities:
+            append(source, sink, demand)
+
+    def to_commodities(self, commodity_class):
+        '''
+        Returns a list of commodity_class(source, sink, demand) with node
+        labels, for code that needs one object per commodity
+        '''
+        nodes, sources, sinks, demands = (self.graph.nodes, self.sources,
+                                          self.sinks, self.demands)
+        return [commodity_class(nodes[sources[idx]], nodes[sinks[idx]], demands[idx])
+                for idx in xrange(len(demands))]
@@ -0,0 +1,303 @@
+'''
+Compressed sparse row (CSR) graph used as the core of the concurrent flow
+solver. The topology is built once from a list of Edge objects; lengths,
+capacities and flows live in flat float arrays indexed by edge id so the
+solver never touches per-edge attribute dicts. When numpy is available the
+same buffers are also exposed as numpy vectors for batched updates.
+'''
+from array import array
+from math import exp
+from math import log
+import sys
+
+from edge_arrays import EdgeArrays
+
+try:
+    import numpy as np
+except ImportError:  # e.g. under pypy; every kernel has a scalar loop
+    np = None
+
+
+# batches with fewer edges than this are cheaper to update in a Python loop
+VECTOR_MIN_EDGES = 32
+
+# scaled lengths are divided by 2 ** RENORMALISE_BITS once D(l) passes
+# RENORMALISE_LIMIT, and never drop below the smallest normal float
+RENORMALISE_BITS = 512
+RENORMALISE_LIMIT = 2. ** RENORMALISE_BITS
+MIN_LENGTH = sys.float_info.min
+
+
+class CSRGraph(object):
+    '''
+    Directed graph in compressed sparse row form.
+
+    Built from a list of Edge objects or an EdgeArrays.  Nodes are
+    relabelled to 0..n-1 in order of first appearance (nodes[i] is the
+    original label of node i, node_index maps labels back).  The edges
+    leaving node u have the ids offsets[u] .. offsets[u + 1] - 1, and
+    edge_ids[i] is the edge id given to the i-th Edge passed in.
+
+    capacity_vec, length_vec and flow_vec are zero-copy numpy views of the
+    capacity, length and flow arrays, or None without numpy.
+
+    The true length of edge e is length[e] * exp(log_scale).  log_scale stays
+    0 unless the graph is reset with reset_log, which keeps lengths (and the
+    tracked objective) as mantissas around 1 so tiny deltas cannot underflow.
+    Shortest paths only compare lengths, so they are unaffected by the scale.
+
+    augmentations counts the calls of augment and route.
+    '''
+
+    def __init__(self, edges):
+        if isinstance(edges, EdgeArrays):
+            # copied, as the arrays may keep growing
+            nodes, node_index = list(edges.nodes), dict(edges.node_index)
+        else:
+            edges = EdgeArrays.from_edges(edges)
+            nodes, node_index = edges.nodes, edges.node_index
+        edge_heads, edge_tails, edge_capacity = edges.heads, edges.tails, edges.capacity
+        n, m = len(nodes), len(edges)
+
+        # counting sort of the edges by head node
+        offsets = [0] * (n + 1)
+        for u in edge_heads:
+            offsets[u + 1] += 1
+        for u in xrange(n):
+            offsets[u + 1] += offsets[u]
+        position = offsets[:-1]
+
+        heads, tails, edge_ids = [0] * m, [0] * m, [0] * m
+        capacity = [0.] * m
+        for idx in xrange(m):
+            u = edge_heads[idx]
+            eid = position[u]
+            position[u] += 1
+            heads[eid] = u
+            tails[eid] = edge_tails[idx]
+            capacity[eid] = edge_capacity[idx]
+            edge_ids[idx] = eid
+
+        self._setup(nodes, node_index, array('l', offsets), array('l', heads),
+                    array('l', tails), array('l', edge_ids), array('d', capacity))
+
+    @classmethod
+    def from_arrays(cls, nodes, offsets, heads, tails, edge_ids, capacity):
+        '''
+        Builds a graph around existing topology and capacity arrays without
+        copying them, e.g. views into a shared mapping (see shared_graph).
+        Only the length and flow arrays are allocated.
+        '''
+        graph = cls.__new__(cls)
+        node_index = dict((node, u) for u, node in enumerate(nodes))
+        graph._setup(nodes, node_index, offsets, heads, tails, edge_ids, capacity)
+        return graph
+
+    def _setup(self, nodes, node_index, offsets, heads, tails, edge_ids, capacity):
+        m = len(capacity)
+        self.nodes = nodes
+        self.node_index = node_index
+        self.num_nodes = len(nodes)
+        self.num_edges = m
+        self.offsets = offsets
+        self.heads = heads
+        self.tails = tails
+        self.edge_ids = edge_ids
+        self.capacity = capacity
+        self.length = array('d', [0.]) * m
+        self.flow = array('d', [0.]) * m
+        self.objective = 0.  # scaled D(l), kept up to date as lengths change
+        self.log_scale = 0.
+        self.augmentations = 0
+
+        if np is not None:
+            self.capacity_vec = np.frombuffer(self.capacity, dtype=np.float64)
+            self.length_vec = np.frombuffer(self.length, dtype=np.float64)
+            self.flow_vec = np.frombuffer(self.flow, dtype=np.float64)
+        else:
+            self.capacity_vec = self.length_vec = self.flow_vec = None
+
+    def _vectorise(self, count):
+        return self.length_vec is not None and count >= VECTOR_MIN_EDGES
+
+    def reset(self, delta):
+        '''
+        Sets every edge length to delta / capacity and clears all flow
+        '''
+        if self._vectorise(self.num_edges):
+            self.length_vec[:] = delta / self.capacity_vec
+            self.flow_vec[:] = 0.
+        else:
+            capacity, length, flow = self.capacity, self.length, self.flow
+            for eid in xrange(self.num_edges):
+                length[eid] = delta / capacity[eid]
+                flow[eid] = 0.
+        self.log_scale = 0.
+        self.objective = self.dual_objective()
+
+    def reset_log(self, log_delta):
+        '''
+        Sets every true edge length to exp(log_delta) / capacity, stored as
+        1 / capacity with log_scale = log_delta, and clears all flow
+        '''
+        self.reset(1.)
+        self.log_scale = log_delta
+
+    def restore(self, length, flow, log_scale):
+        '''
+        Loads lengths (as mantissas for log_scale) and flows saved from a
+        graph with the same edges, e.g. by a SolverState
+        '''
+        if len(length) != self.num_edges or len(flow) != self.num_edges:
+            raise ValueError('saved state has %d edges, graph has %d'
+                             % (len(length), self.num_edges))
+        self.length[:] = array('d', length)
+        self.flow[:] = array('d', flow)
+        self.log_scale = log_scale
+        self.refresh_objective()
+
+    def log_objective(self):
+        '''
+        Returns log D(l) in true units, -inf while D(l) is zero
+        '''
+        if self.objective <= 0:
+            return float('-inf')
+        return log(self.objective) + self.log_scale
+
+    def true_objective(self):
+        return self.objective * exp(self.log_scale)
+
+    def renormalise(self):
+        '''
+        Divides every length by 2 ** RENORMALISE_BITS and folds the factor
+        into log_scale if the tracked D(l) has passed RENORMALISE_LIMIT.
+        Powers of two rescale exactly; lengths that would go denormal are
+        clamped to MIN_LENGTH.  Returns True if the lengths were rescaled.
+        '''
+        if self.objective < RENORMALISE_LIMIT:
+            return False
+        factor = 2. ** -RENORMALISE_BITS
+        if self._vectorise(self.num_edges):
+            self.length_vec *= factor
+            np.maximum(self.length_vec, MIN_LENGTH, out=self.length_vec)
+        else:
+            length = self.length
+            for eid in xrange(self.num_edges):
+                length[eid] = max(length[eid] * factor, MIN_LENGTH)
+        self.log_scale += RENORMALISE_BITS * log(2)
+        self.refresh_objective()
+        return True
+
+    def out_edges(self, u):
+        return xrange(self.offsets[u], self.offsets[u + 1])
+
+    def dual_objective(self):
+        '''
+        Calculates the scaled D(l) = sum c(e)l(e) over all e from scratch
+        '''
+        if self._vectorise(self.num_edges):
+            return float(np.dot(self.length_vec, self.capacity_vec))
+        capacity, length = self.capacity, self.length
+        total = 0.
+        for eid in xrange(self.num_edges):
+            total += length[eid] * capacity[eid]
+        return total
+
+    def path_length(self, path):
+        length = self.length
+        return sum(length[eid] for eid in path)
+
+    def min_capacity(self, path):
+        capacity = self.capacity
+        return min(capacity[eid] for eid in path)
+
+    def refresh_objective(self):
+        '''
+        Recomputes the tracked D(l) to shed accumulated rounding error
+        '''
+        self.objective = self.dual_objective()
+        return self.objective
+
+    def augment(self, path, added_flow, epsilon):
+        '''
+        Routes added_flow along the edge ids in path and multiplies each
+        length by (1 + epsilon * added_flow / capacity)
+        '''
+        if self._vectorise(len(path)):
+            idx = np.asarray(path)
+            self.flow_vec[idx] += added_flow
+            lengths = self.length_vec[idx]
+            self.length_vec[idx] = lengths * (1 + epsilon * added_flow / self.capacity_vec[idx])
+            grown = float(lengths.sum())
+        else:
+            capacity, length, flow = self.capacity, self.length, self.flow
+            grown = 0.
+            for eid in path:
+                flow[eid] += added_flow
+                grown += length[eid]
+                length[eid] *= 1 + epsilon * added_flow / capacity[eid]
+        # c(e)l(e) grows by l(e) * epsilon * added_flow on every path edge
+        self.objective += grown * epsilon * added_flow
+        self.augmentations += 1
+
+    def route(self, eids, amounts, epsilon):
+        '''
+        Adds amounts[i] of flow to edge eids[i] and multiplies its length by
+        (1 + epsilon * amounts[i] / capacity).  Edge ids must be distinct.
+        '''
+        if self._vectorise(len(eids)):
+            idx = np.asarray(eids)
+            amounts = np.asarray(amounts, dtype=np.float64)
+            self.flow_vec[idx] += amounts
+            grown = self._lengthen_vec(idx, amounts, epsilon)
+        else:
+            flow = self.flow
+            for eid, added_flow in zip(eids, amounts):
+                flow[eid] += added_flow
+            grown = self._lengthen(eids, amounts, epsilon)
+        self.objective += grown * epsilon
+        self.augmentations += 1
+
+    def _lengthen(self, eids, amounts, epsilon):
+        capacity, length = self.capacity, self.length
+        grown = 0.
+        for eid, added_flow in zip(eids, amounts):
+            grown += length[eid] * added_flow
+            length[eid] *= 1 + epsilon * added_flow / capacity[eid]
+        return grown
+
+    def _lengthen_vec(self, idx, amounts, epsilon):
+        lengths = self.length_vec[idx]
+        self.length_vec[idx] = lengths * (1 + epsilon * amounts / self.capacity_vec[idx])
+        return float(np.dot(lengths, amounts))
+
+    def bottleneck_scale(self, eids, amounts):
+        '''
+        Returns the largest factor up to 1 by which amounts[i] can be scaled
+        without exceeding the capacity of edge eids[i]
+        '''
+        if self._vectorise(len(eids)):
+            ratios = self.capacity_vec[np.asarray(eids)] / np.asarray(amounts, dtype=np.float64)
+            return min(1., float(ratios.min()))
+        capacity = self.capacity
+        scale = 1.
+        for eid, amount in zip(eids, amounts):
+            scale = min(scale, capacity[eid] / amount)
+        return scale
+
+    def scale_flows(self, factor):
+        if self._vectorise(self.num_edges):
+            self.flow_vec *= factor
+            return
+        flow = self.flow
+        for eid in xrange(self.num_edges):
+            flow[eid] *= factor
+
+    def max_congestion(self):
+        '''
+        Returns the largest flow / capacity ratio over all edges
+        '''
+        if self._vectorise(self.num_edges):
+            return float((self.flow_vec / self.capacity_vec).max())
+        capacity, flow = self.capacity, self.flow
+        return max(flow[eid] / capacity[eid] for eid in xrange(self.num_edges))
@@ -0,0 +1,163 @@
+'''
+Shortest path engine for the concurrent flow solver. Runs Dijkstra with a
+heapq binary heap directly over the arrays of a CSRGraph, reusing the same
+distance, predecessor and heap buffers for every call.
+'''
+from array import array
+from heapq import heappop
+from heapq import heappush
+
+import networkx as nx
+
+
+# relative slack tolerated before a tree edge counts as beaten by a shortcut
+_SLACK = 1e-12
+
+
+class DijkstraEngine(object):
+    '''
+    Single source shortest paths over the current lengths of a CSRGraph.
+
+    Buffers are allocated once; a node's entries are only valid if its stamp
+    matches the generation of the latest run, so nothing is cleared between
+    calls.  Results of a run are overwritten by the next one.
+
+    The heap holds (distance, node) entries.  A node whose distance drops is
+    pushed again instead of being moved, and entries of settled nodes are
+    skipped when popped, which is faster in Python than an indexed heap.
+    '''
+
+    def __init__(self, graph):
+        n = graph.num_nodes
+        self.graph = graph
+        self.dist = array('d', [0.]) * n
+        self.pred = array('l', [-1]) * n
+        self.stamp = array('l', [0]) * n
+        self.done = array('l', [0]) * n  # the generation a node settled in
+        self.heap = []
+        self.order = array('l', [0]) * n  # nodes in the order they settled
+        self.num_settled = 0
+        self.generation = 0
+        self.source = -1
+
+    def run(self, source, sink=-1):
+        '''
+        Settles nodes in order of distance from source, stopping as soon as
+        sink is settled.  With sink=-1 the full shortest path tree is built.
+        '''
+        graph = self.graph
+        offsets, tails, length = graph.offsets, graph.tails, graph.length
+        dist, pred, stamp, done = self.dist, self.pred, self.stamp, self.done
+        heap, order = self.heap, self.order
+
+        self.generation += 1
+        generation = self.generation
+        self.source = source
+        dist[source] = 0.
+        pred[source] = -1
+        stamp[source] = generation
+        del heap[:]  # left over if the last run stopped at its sink
+        heap.append((0., source))
+        num_settled = 0
+
+        while heap:
+            du, u = heappop(heap)
+            if done[u] == generation:
+                continue  # stale entry of a node settled at a smaller distance
+            done[u] = generation
+            order[num_settled] = u
+            num_settled += 1
+            if u == sink:
+                break
+            for eid in xrange(offsets[u], offsets[u + 1]):
+                v = tails[eid]
+                nd = du + length[eid]
+                if stamp[v] != generation:
+                    stamp[v] = generation
+                    dist[v] = nd
+                    pred[v] = eid
+                    heappush(heap, (nd, v))
+                elif nd < dist[v] and done[v] != generation:
+                    dist[v] = nd
+                    pred[v] = eid
+                    heappush(heap, (nd, v))
+        self.num_settled = num_settled
+
+    def revalidate(self):
+        '''
+        Checks whether the tree of the last full run is still a shortest path
+        tree under the current lengths.
+
+        Tree distances are first recomputed along the existing predecessor
+        edges, then every edge out of a reached node is checked for a
+        shortcut.  This is O(m) with no heap work.  Returns True and keeps
+        the refreshed distances if the tree is still valid.
+        '''
+        graph = self.graph
+        offsets, heads, tails, length = (graph.offsets, graph.heads,
+                                         graph.tails, graph.length)
+        dist, pred, order = self.dist, self.pred, self.order
+        num_settled = self.num_settled
+
+        for idx in xrange(1, num_settled):
+            v = order[idx]
+            eid = pred[v]
+            dist[v] = dist[heads[eid]] + length[eid]
+
+        for idx in xrange(num_settled):
+            u = order[idx]
+            du = dist[u]
+            for eid in xrange(offsets[u], offsets[u + 1]):
+                dv = dist[tails[eid]]
+                if du + length[eid] < dv - dv * _SLACK:
+                    return False
+        return True
+
+    def settled(self, node):
+        return self.done[node] == self.generation
+
+    def distance(self, node):
+        '''
+        Distance from the last source to node, None if it was not settled
+        '''
+        if not self.settled(node):
+            return None
+        return self.dist[node]
+
+    def path(self, sink):
+        '''
+        Returns the edge ids on the shortest path from the last source to sink
+        '''
+        if not self.settled(sink):
+            graph = self.graph
+            raise nx.NetworkXNoPath('node %s not reachable from %s'
+                                    % (graph.nodes[sink], graph.nodes[self.source]))
+        heads, pred = self.graph.heads, self.pred
+        path = []
+        node = sink
+        while node != self.source:
+            eid = pred[node]
+            path.append(eid)
+            node = heads[eid]
+        path.reverse()
+        return path
+
+    def shortest_path(self, source, sink):
+        self.run(source, sink)
+        return self.path(sink)
+
+    def distances(self, source, sinks):
+        '''
+        Returns the shortest path distances from source to each of sinks,
+        stopping early when there is only one sink
+        '''
+        if len(sinks) == 1:
+            self.run(source, sinks[0])
+        else:
+            self.run(source)
+        result = []
+        for sink in sinks:
+            if not self.settled(sink):
+                self.path(sink)  # raises NetworkXNoPath
+            result.append(self.dist[sink])
+        return result
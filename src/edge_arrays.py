@@ -0,0 +1,91 @@
+'''
+Struct-of-arrays edge list for instances too large for one Edge object per
+edge.  Nodes are numbered in order of first appearance, exactly as CSRGraph
+numbers them, so a CSRGraph is built from an EdgeArrays without touching
+any per-edge object.
+'''
+from array import array
+
+
+class EdgeView(object):
+    '''
+    Edge-like view of one entry of an EdgeArrays; capacity writes through
+    '''
+    __slots__ = ('edges', 'index')
+
+    def __init__(self, edges, index):
+        self.edges = edges
+        self.index = index
+
+    @property
+    def head(self):
+        return self.edges.nodes[self.edges.heads[self.index]]
+
+    @property
+    def tail(self):
+        return self.edges.nodes[self.edges.tails[self.index]]
+
+    @property
+    def capacity(self):
+        return self.edges.capacity[self.index]
+
+    @capacity.setter
+    def capacity(self, value):
+        self.edges.capacity[self.index] = value
+
+
+class EdgeArrays(object):
+    '''
+    Edges as parallel arrays: heads[i] and tails[i] are node indices (nodes
+    maps them back to labels) and capacity[i] is the capacity of edge i.
+    Indexing or iterating yields EdgeView objects.
+    '''
+
+    def __init__(self, edges=()):
+        self.nodes = []
+        self.node_index = {}
+        self.heads = array('l')
+        self.tails = array('l')
+        self.capacity = array('d')
+        self.extend(edges)
+
+    @classmethod
+    def from_edges(cls, edges):
+        '''
+        Builds the arrays from Edge-like objects with head, tail and capacity
+        '''
+        return cls((edge.head, edge.tail, edge.capacity) for edge in edges)
+
+    def _node(self, label):
+        index = self.node_index.get(label)
+        if index is None:
+            index = self.node_index[label] = len(self.nodes)
+            self.nodes.append(label)
+        return index
+
+    def append(self, head, tail, capacity):
+        self.heads.append(self._node(head))
+        self.tails.append(self._node(tail))
+        self.capacity.append(capacity)
+
+    def extend(self, edges):
+        '''
+        Adds every (head, tail, capacity) triple of an iterable
+        '''
+        append = self.append
+        for head, tail, capacity in edges:
+            append(head, tail, capacity)
+
+    def __len__(self):
+        return len(self.capacity)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('edge index out of range')
+        return EdgeView(self, index)
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield EdgeView(self, index)
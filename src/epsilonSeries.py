@@ -16,21 +16,6 @@ def make_commodity_distributions(commodities):
             [half, commodities - half],
             [1 for _ in range(commodities)])
 
-def make_file_name(nodes, edges, commodities, commodity_distribution,
-                   two_factor=False, karakosta=False, multi_route=False):
-    if two_factor or karakosta or multi_route:
-        opt_string = '_'
-        if two_factor:
-            opt_string += 'b'
-        if karakosta:
-            opt_string += 'k'
-        if multi_route:
-            opt_string += 'm'
-    else:
-        opt_string = ''
-    com_dist = len(commodity_distribution)
-    return 'data2/omega_series_%d_%d_%d%s_%d.pkl' % (nodes, edges, commodities, opt_string, com_dist)
-
 node = int(raw_input("node: "))
 
 # for node, edge, commodity in product(nodes, edges, commodities):
@@ -38,9 +23,7 @@ for edge, commodity in product(edges, commodities):
     for commodity_distribution in make_commodity_distributions(commodity):
         for two_factor, karakosta in product([True, False],
                                              [True, False], ):
-            name = make_file_name(node, edge, commodity, commodity_distribution,
-                                  two_factor, karakosta, )
-            print node, edge, commodity, name, omegas, commodity_distribution, two_factor, karakosta
-            run_series(node, edge, commodity, name, omegas,
+            print node, edge, commodity, omegas, commodity_distribution, two_factor, karakosta
+            run_series(node, edge, commodity, omegas,
                        commodity_distribution, two_factor, karakosta, )
 
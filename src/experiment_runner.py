@@ -0,0 +1,181 @@
+'''
+Parallel runner for experiment sweeps.
+
+A sweep is expanded into Tasks, one per solver run, and the tasks are run
+on a bounded process pool.  Every task solves its own copy of an instance
+generated from a seed derived from the sweep seed and the instance
+parameters, mapped from the instance library (see random_instances), so:
+- all algorithms and omegas of a repeat see the same instance;
+- results do not depend on which worker ran which task;
+- a solver scaling demands in place cannot leak into the next run.
+
+Results are appended to a ResultStore as soon as each task finishes.  The
+store is also the checkpoint of the sweep.  Rerunning a sweep with the same
+store skips every cell already recorded in it, where a cell is the task's
+instance parameters, seed, omega and algorithm.  A sweep killed at any
+point therefore resumes where it stopped.  Failed runs are recorded too,
+so a cell whose run raised is skipped as well, unless the sweep is rerun
+with retry_failed; cells without an instance are never retried, as their
+seed would fail the same way.
+'''
+import hashlib
+from multiprocessing import Pool
+import time
+
+from max_concurrent_flow import maximum_concurrent_flow
+from max_concurrent_flow import multi_route
+from max_concurrent_flow import two_approx
+from random_instances import INSTANCE_DIR
+from random_instances import cached_random_input
+from random_instances import prepare_random_input
+from result_store import ResultStore
+from result_store import cell_key
+
+
+# solver and keyword arguments of each algorithm name
+SOLVERS = {
+    'vanilla': (maximum_concurrent_flow, {}),
+    'two_approx': (two_approx, {'karakosta': False}),
+    'karakosta': (maximum_concurrent_flow, {'karakosta': True}),
+    'two_approx_karakosta': (two_approx, {'karakosta': True}),
+    'multi_route': (multi_route, {}),
+}
+ALGORITHMS = ('vanilla', 'two_approx', 'karakosta', 'two_approx_karakosta')
+
+# error of a task whose instance could not be generated
+NO_INSTANCE = 'no connected graph'
+
+
+def instance_seed(seed, key):
+    '''
+    Returns a seed for the instance identified by key, stable across
+    processes and runs
+    '''
+    return int(hashlib.md5(repr((seed, key))).hexdigest()[:8], 16)
+
+
+class Task(object):
+    '''
+    One solver run: algorithm with error omega on the random instance with
+    the given numbers of nodes, edges and commodities, commodity
+    distribution and repeat number, generated from seed.  The instance is
+    taken from the library in the directory instances, or generated in
+    memory if instances is None.
+    '''
+
+    def __init__(self, index, nodes, edges, commodities, distribution, omega,
+                 algorithm, repeat, seed, instances=INSTANCE_DIR):
+        self.index = index
+        self.nodes = nodes
+        self.edges = edges
+        self.commodities = commodities
+        self.distribution = distribution
+        self.omega = omega
+        self.algorithm = algorithm
+        self.repeat = repeat
+        self.seed = seed
+        self.instances = instances
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+def make_tasks(configs, omegas, algorithms=ALGORITHMS, repeats=10, seed=0,
+               instances=INSTANCE_DIR):
+    '''
+    Expands a sweep into Tasks, ordered by repeat, then config, omega and
+    algorithm.  configs is an iterable of (nodes, edges, commodities,
+    distribution) tuples, distribution being None or a list of group sizes.
+    instances is the instance library directory, None to not use one.
+    '''
+    configs = list(configs)
+    tasks = []
+    for repeat in xrange(repeats):
+        for nodes, edges, commodities, distribution in configs:
+            distribution = list(distribution) if distribution else None
+            key = (nodes, edges, commodities, distribution, repeat)
+            taskSeed = instance_seed(seed, key)
+            for omega in omegas:
+                for algorithm in algorithms:
+                    tasks.append(Task(len(tasks), nodes, edges, commodities,
+                                      distribution, omega, algorithm, repeat,
+                                      taskSeed, instances))
+    return tasks
+
+
+def run_task(task):
+    '''
+    Loads or generates the instance of task and solves it.  Returns the
+    task's fields with spc, iterations, seconds and error; a failed run has
+    spc, iterations and seconds None and the reason in error.
+    '''
+    result = task.as_dict()
+    result.update(spc=None, iterations=None, seconds=None, error=None)
+    if task.instances is None:
+        edges, commodities = prepare_random_input(task.nodes, task.edges, task.commodities,
+                                                  task.distribution, seed=task.seed)
+    else:
+        edges, commodities = cached_random_input(task.nodes, task.edges, task.commodities,
+                                                 task.distribution, task.seed,
+                                                 task.instances)
+    if edges is None:
+        result['error'] = NO_INSTANCE
+        return result
+
+    solver, options = SOLVERS[task.algorithm]
+    start = time.time()
+    try:
+        spc, iterations = solver(edges, commodities, task.omega, **options)[:2]
+    except Exception as error:
+        result['error'] = repr(error)
+    else:
+        result.update(spc=spc, iterations=iterations, seconds=time.time() - start)
+    return result
+
+
+def run_tasks(tasks, store=None, processes=None, resume=True, retry_failed=False):
+    '''
+    Runs tasks on a pool of processes workers (one per core by default;
+    1 runs them in this process) and returns their results in task order.
+    If store (a ResultStore or the path of one) is given each result is
+    appended to it as soon as it finishes; with resume, tasks whose cell is
+    already recorded there are not run again and their recorded results
+    are returned.  With retry_failed, tasks whose latest record is a failed
+    run (other than NO_INSTANCE) are run again.
+    '''
+    opened = isinstance(store, basestring)
+    if opened:
+        store = ResultStore(store)
+    results = []
+    if store is not None and resume:
+        recorded = store.recorded([task.as_dict() for task in tasks])
+        remaining = []
+        for task in tasks:
+            result = recorded.get(cell_key(task.as_dict()))
+            if result is None or (retry_failed and result['error'] is not None
+                                  and result['error'] != NO_INSTANCE):
+                remaining.append(task)
+            else:
+                result['index'] = task.index
+                results.append(result)
+        tasks = remaining
+
+    pool = None
+    try:
+        if processes == 1 or not tasks:
+            finished = (run_task(task) for task in tasks)
+        else:
+            pool = Pool(processes)
+            finished = pool.imap_unordered(run_task, tasks)
+        for result in finished:
+            results.append(result)
+            if store is not None:
+                store.append(result)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        if opened:
+            store.close()
+    results.sort(key=lambda result: result['index'])
+    return results
@@ -16,71 +16,15 @@ Algorithms we want to use:
 -Alogrithm with karakosta
 '''
 
-import random
-import pickle
-import time
-
-import networkx as nx
-
+from experiment_runner import ALGORITHMS
+from experiment_runner import NO_INSTANCE
+from experiment_runner import make_tasks
+from experiment_runner import run_tasks
 from max_concurrent_flow import *
-
-
-def random_connected_graph(numNodes, numEdges):
-    '''Generates a weakly connected random graph with numNodes nodes
-       and numEdges edges
-    '''
-    tries = 0
-    while tries < 100:
-        tries += 1
-        random_graph = nx.gnm_random_graph(numNodes,numEdges,directed = True)
-        if nx.is_weakly_connected(random_graph): 
-            return random_graph
-    return None
-
-def randomCommodities(random_graph, numCommodities, commodityDistribution = None):
-    '''Generates a list of commodities with reachable source and sink
-       and numCommodity groups numbers of commodities with the same starting source
-    '''
-
-    edgeDict = random_graph.edge
-    nodes = set([key for key in edgeDict.iterkeys()])
-    commodities = []
-    commodityDistribution = commodityDistribution or [1] * numCommodities
-    assert len(commodityDistribution) <= len(nodes)
-    for xCommodities in commodityDistribution:
-        done = False
-        while not done:
-            randomChoice = random.sample(nodes, 1)[0]
-            possSinks = [k for k in nx.shortest_path(random_graph,randomChoice).iterkeys()]
-            possSinks.remove(randomChoice)
-            if len(possSinks) < xCommodities:
-                pass
-            else:
-                nodes.remove(randomChoice)
-                sinks = random.sample(possSinks, xCommodities)
-                
-                for sink in sinks:
-                    commodities.append(Commodity(randomChoice, sink, random.randint(1,50)))
-                done = True
-    assert len(commodities) == numCommodities
-    for commodity in commodities:
-        assert(commodity.sink in nx.shortest_path(random_graph, commodity.source))
-    return commodities
-
-
-def prepare_random_input(numNodes,numEdges,numCommodities,commodityDistribution=None):
-    print "Making random graph"
-    random_graph = random_connected_graph(numNodes,numEdges)
-    if random_graph is None:
-        return None, None
-    print "Finished making random graph\n Making random commodities"
-    commodities = randomCommodities(random_graph, numCommodities, commodityDistribution)
-    print "Finished making random commodities"
-    edgeList = []
-    for head,v in random_graph.edge.iteritems():
-        for tail in v.iterkeys():
-            edgeList.append(Edge(head,tail, random.randint(2,10)))
-    return edgeList, commodities
+from random_instances import prepare_random_input
+from random_instances import randomCommodities
+from random_instances import random_connected_graph
+from result_store import ResultStore
 
 
 def check_iterable(obj):
@@ -88,172 +32,97 @@ def check_iterable(obj):
 
 
 def run_multiple(numNodes, numEdges, numCommodities, omegas,
-                 commodityDistributions, heuristic=None):
-    start_time = int(time.time())
-
-    def run_vanilla(edge, commodity, omega):
-        vanilla_start = time.time()
-        try:
-            spc, iterations = maximum_concurrent_flow(edge, commodity, omega)
-        except:
-            spc, iterations = None, None
-        vanilla_end = time.time() - vanilla_start
-        outData['vanilla'].append((spc, iterations, vanilla_end))
-        print "finished vanilla in", vanilla_end, "seconds"
-
-    def run_two_approx(edge, commodity, omega):
-        two_approx_start = time.time()
-        try:
-            spc, iterations = two_approx(edge, commodity, omega)
-        except:
-            spc, iterations = None, None
-        two_approx_end = time.time() - two_approx_start
-        outData['two_approx'].append((spc, iterations, two_approx_end))
-        print "finished two_approx in", two_approx_end, "seconds"
-
-    def run_karakosta(edge, commodity, omega):
-        karakosta_start = time.time()
-        try:
-            spc, iterations = maximum_concurrent_flow(edge, commodity,
-                                                      omega, karakosta=True)
-        except:
-            spc, iterations = None, None
-        karakosta_end = time.time() - karakosta_start
-        outData['karakosta'].append((spc, iterations, karakosta_end))
-        print "finished karakosta in", karakosta_end, "seconds"
-
-    def run_two_approx_karakosta(edge, commodity, omega):
-        two_approx_karakosta_start = time.time()
-        try:
-            spc, iterations = two_approx(edge, commodity, omega, karakosta=True)
-        except:
-            spc, iterations = None, None
-        two_approx_karakosta_end = time.time() - two_approx_karakosta_start
-        outData['two_approx_karakosta'].append((spc, iterations,
-                                                two_approx_karakosta_end))
-        print "finished two_approx_karakosta in", two_approx_karakosta_end, "seconds"
-
-    def individual_loop(edge, commodity, omega):
-        if heuristic == "vanilla":
-            run_vanilla(edge, commodity, omega)
-
-        else:
-            run_vanilla(edge, commodity, omega)
-            run_two_approx(edge, commodity, omega)
-            run_karakosta(edge, commodity, omega)
-            run_two_approx_karakosta(edge, commodity, omega)
-
-    totalData = []
-
-    for idx in range(10):
-        print "ITERATION", idx
-        outData = {
-            'vanilla': [],
-            'two_approx': [],
-            'karakosta': [],
-            'two_approx_karakosta': [],
-        }
-        if check_iterable(numNodes):
-            outFile = 'data3/nodes.pkl'
-            omega = omegas
-            for node in numNodes:
-                edges = numEdges * node
-                edge, commodity = prepare_random_input(node, edges,
-                                                       numCommodities,
-                                                       commodityDistributions)
-                individual_loop(edge, commodity, omega)
-        elif check_iterable(omegas):
-            outFile = 'data3/omegas.pkl'
-            node = numNodes
-            edge, commodity = prepare_random_input(node, numEdges,
-                                                   numCommodities,
-                                                   commodityDistributions)
-            for omega in omegas:
-                individual_loop(edge, commodity, omega)
-        elif check_iterable(numCommodities):
-            outFile = 'data3/commodities.pkl'
-            node, omega = numNodes, omegas
-            for commodity in numCommodities:
-                distribution = [int(commodity * x) for x in
-                                commodityDistributions]
-                edge, commodity = prepare_random_input(node, numEdges,
-                                                       commodity,
-                                                       distribution,)
-                individual_loop(edge, commodity, omega)
-        elif check_iterable(commodityDistributions):
-            outFile = 'data3/distributions.pkl'
-            node, omega = numNodes, omegas
-            for distribution in commodityDistributions:
-                edge, commodity = prepare_random_input(node, numEdges,
-                                                       numCommodities,
-                                                       distribution)
-                individual_loop(edge, commodity, omega)
-        totalData.append(outData)
-
-        pickle.dump(totalData, open(outFile + '_%d' % start_time,'wb'))
-
-
-def run_series(numNodes, numEdges, numCommodities, outFile, omegas,
+                 commodityDistributions, heuristic=None, processes=None,
+                 repeats=10, seed=0, store='data3/results.db', retry_failed=False):
+    '''Runs the algorithms on repeats random instances per configuration.
+       Whichever of numNodes (with numEdges edges per node), omegas,
+       numCommodities (with commodityDistributions as fractions) or
+       commodityDistributions is a list is swept over.  Runs go on a pool of
+       processes workers and are recorded in the ResultStore at store,
+       which also lets a killed sweep resume (rerun it with another seed for
+       new instances; with retry_failed, the runs that failed are run
+       again).  Returns the result records in task order.
+    '''
+    if check_iterable(numNodes):
+        configs = [(node, numEdges * node, numCommodities, commodityDistributions)
+                   for node in numNodes]
+        omegas = [omegas]
+    elif check_iterable(omegas):
+        configs = [(numNodes, numEdges, numCommodities, commodityDistributions)]
+    elif check_iterable(numCommodities):
+        configs = [(numNodes, numEdges, commodity,
+                    [int(commodity * x) for x in commodityDistributions])
+                   for commodity in numCommodities]
+        omegas = [omegas]
+    elif check_iterable(commodityDistributions):
+        configs = [(numNodes, numEdges, numCommodities, distribution)
+                   for distribution in commodityDistributions]
+        omegas = [omegas]
+
+    algorithms = ['vanilla'] if heuristic == "vanilla" else ALGORITHMS
+    tasks = make_tasks(configs, omegas, algorithms, repeats, seed)
+    return run_tasks(tasks, store, processes, retry_failed=retry_failed)
+
+
+def algorithm_name(two_factor=False, karakosta=False, multi_route=False):
+    if multi_route:
+        return 'multi_route'
+    if two_factor:
+        return 'two_approx_karakosta' if karakosta else 'two_approx'
+    return 'karakosta' if karakosta else 'vanilla'
+
+
+def run_series(numNodes, numEdges, numCommodities, omegas,
                commodityDistribution=None, two_factor=False, karakosta=False,
-               multi_route=False):
-    outData = {}
-    for idx in range(10):
-        edgeList,commodities = prepare_random_input(numNodes,numEdges,
-                                                    numCommodities,commodityDistribution)
-        if edgeList is None and commodities is None:
-            continue
-
-        for omega in omegas:
-            print "ITERATION: %d; OMEGA: %f" % (idx, omega)
-            now = time.time()
-            try:
-                if two_factor:
-                    spc, iterations = two_approx(edgeList, commodities,
-                                                error=omega, karakosta=karakosta)
-                else:
-                    spc, iterations = maximum_concurrent_flow(edgeList, commodities,
-                                                            error=omega,
-                                                            karakosta=karakosta)
-                if omega not in outData: outData[omega] = []
-                outData[omega].append((spc,iterations,time.time()-now))
-            except:
-                outData[omega].append((None, None, None))
-
-    pickle.dump(outData,open(outFile,'wb'))
-
-
-def generate_csv(pkl_file_name):
-    data = pickle.load(open(pkl_file_name))
-
-    averaged_data = {}
-    for omega, datum in data.iteritems():
-        spc_total, iterations_total, seconds_total = 0., 0., 0.
-
-        for spc, iterations, seconds in datum:
-            spc_total += float(spc)
-            iterations_total += float(iterations)
-            seconds_total += float(iterations)
-
-        spc_total /= len(datum)
-        iterations_total /= len(datum)
-        seconds_total /= len(datum)
-
-        averaged_data[omega] = (spc_total, iterations_total, seconds_total)
-    
-    with open(pkl_file_name.rstrip('pkl') + 'csv', 'w') as f:
-        f.write('w, num_shortest_paths, num_iterations, num_seconds')
-        for key in sorted(averaged_data.keys(), reverse=True):
-            f.write('%s, %s, %s, %s\n' % ((key, ) + averaged_data[key]))
+               multi_route=False, processes=None, repeats=10, seed=0,
+               store='data2/results.db', retry_failed=False):
+    '''Runs one algorithm for every omega on repeats random instances, on
+       a pool of processes workers.  Runs are recorded in the ResultStore
+       at store, from which a killed series resumes when rerun (see
+       run_multiple for retry_failed).  Returns the result records in task
+       order.
+    '''
+    configs = [(numNodes, numEdges, numCommodities, commodityDistribution)]
+    algorithm = algorithm_name(two_factor, karakosta, multi_route)
+    tasks = make_tasks(configs, omegas, [algorithm], repeats, seed)
+    return run_tasks(tasks, store, processes, retry_failed=retry_failed)
+
+
+def generate_csv(csv_file_name, store='data2/results.db', **equals):
+    '''Writes the mean spc, iterations and seconds per omega of the runs in
+       the ResultStore at store matching equals (e.g. the nodes, edges,
+       commodities, distribution and algorithm of a run_series) to a csv
+       file, with the number of failed runs, which are left out of the
+       means.  Runs without an instance are left out altogether.
+    '''
+    # numpy is only needed here, and may be missing under pypy
+    from result_report import ResultArrays
+    from result_report import summarise
+
+    results = ResultStore(store)
+    try:
+        records = [record for record in results.select(**equals)
+                   if record['error'] != NO_INSTANCE]
+    finally:
+        results.close()
+    rows = summarise(ResultArrays(records), groupBy=('omega',))
+
+    with open(csv_file_name, 'w') as f:
+        f.write('w, num_shortest_paths, num_iterations, num_seconds, num_failures\n')
+        for row in sorted(rows, key=lambda row: row['omega'], reverse=True):
+            f.write('%s, %s, %s, %s, %s\n' % (row['omega'], row['spc_mean'],
+                                              row['iterations_mean'],
+                                              row['seconds_mean'], row['failures']))
+
+
+# the sweeps of run_experiments.sh, by number
+PRESETS = {
+    '0': ([50, 100, 150, 200], 4, 10, 0.1, [6, 4]),
+    '1': (100, 400, 10, [1, 0.5, 0.4, 0.3, 0.2, 0.1, 0.05], [6, 4]),
+    '2': (100, 400, [5, 10, 15], 0.1, [.6, .4]),
+    '3': (100, 400, 10, 0.1, [[10], [6, 4], [4, 3, 3], [1] * 10]),
+}
 
 
 if __name__ == '__main__':
-    test = raw_input()
-    if test == "0":
-        run_multiple([50, 100, 150, 200], 4, 10, 0.1, [6, 4])
-    elif test == "1":
-        run_multiple(100, 400, 10, [1, 0.5, 0.4, 0.3, 0.2, 0.1, 0.05], [6, 4])
-    elif test == "2":
-        run_multiple(100, 400, [5, 10, 15], 0.1, [.6, .4])
-    elif test == "3":
-        run_multiple(100, 400, 10, 0.1, [[10], [6, 4], [4, 3, 3], [1] * 10])
-
+    run_multiple(*PRESETS[raw_input()])
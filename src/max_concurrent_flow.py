@@ -2,11 +2,29 @@
 Maximum concurrent flow solver using the iterative method on the dual of MCF
 as described in http://cgi.csc.liv.ac.uk/~piotr/ftp/mcf-jv.pdf
 '''
-from math import e
+from array import array
+from itertools import izip
+from math import exp
 from math import log
-import math
+import logging
+import pickle
+import time
+
 import networkx as nx
 
+from commodity_stream import CommodityArrays
+from csr_graph import CSRGraph
+from edge_arrays import EdgeArrays
+from dijkstra import DijkstraEngine
+from max_flow import min_demand_ratio
+from parallel import ParallelPathFinder
+from parallel import route_phase
+from path_enumeration import BoundedPathEnumerator
+from phase_metrics import PhaseMonitor
+from phase_metrics import PhaseTimer
+from phase_metrics import timed
+from tree_routing import SourceTreeRouter
+
 
 # constants
 CAPACITY_ATTRIBUTE = 'capacity'
@@ -15,27 +33,136 @@ FLOW_ATTRIBUTE = '_flow'
 LENGTH_ATTRIBUTE = 'weight'
 FP_ERROR_MARGIN = 10e-10  # floating point error margin
 GLOBAL_ERROR = 0.05
+WARM_GAP_CHECK = 10  # phases between gap checks of a warm start that does not resume
+
+# silent unless the application configures logging or passes a logger;
+# the per edge dump at the end of a run is only built at DEBUG level
+LOGGER = logging.getLogger('max_concurrent_flow')
+LOGGER.addHandler(logging.NullHandler())
 
 
 class Edge(object):
 
-    length = None
+    __slots__ = ('head', 'tail', 'capacity', 'flow', 'length')
 
     def __init__(self, head, tail, capacity):
         self.head = head
         self.tail = tail
         self.capacity = capacity
         self.flow = 0
+        self.length = None
 
 
 class Commodity(object):
 
+    __slots__ = ('source', 'sink', 'demand')
+
     def __init__(self, source, sink, demand):
         self.source = source
         self.sink = sink
         self.demand = demand
 
 
+class SolverState(object):
+    '''
+    Snapshot of a maximum_concurrent_flow run that a later run can continue
+    from: edge lengths (as scaled mantissas, see CSRGraph) and unscaled flows
+    in edge id order, the unscaled flow routed for each commodity, the phase
+    count and the demand scaling that was applied.  scaled tells whether the
+    run scaled demands by z/k (scale_beta) at all; demand_scale is 1 if not.
+    sources and sinks are the node indices of the commodities, so a run can
+    check it resumes with the same ones, and demands their demands as given
+    to the run, so it can tell whether it continues the same run.
+    Picklable; see save and load.
+
+    A run given a state counts its shortest path computations on top of its
+    own.  If the run continues the state's, lengths, flows, phase count and
+    demand scaling are restored.  Otherwise the saved lengths would not give
+    the error bound, so the run starts cold and only uses them for a
+    D(l)/alpha(l) upper bound on lambda, against which it checks the gap
+    (every WARM_GAP_CHECK phases unless gap_check is set).
+    '''
+
+    def __init__(self, graph, log_delta, epsilon, phases, demand_scale,
+                 sources, sinks, demands, shortestPathComputations, commodityFlow=None,
+                 scaled=False):
+        self.length = array('d', graph.length)
+        self.log_scale = graph.log_scale
+        self.flow = array('d', graph.flow)
+        self.log_delta = log_delta
+        self.epsilon = epsilon
+        self.phases = phases
+        self.demand_scale = demand_scale
+        self.scaled = scaled
+        self.sources = array('l', sources)
+        self.sinks = array('l', sinks)
+        self.demands = array('d', demands)
+        self.shortestPathComputations = shortestPathComputations
+        self.commodityFlow = array('d', commodityFlow or [0.] * len(sources))
+
+    def check(self, sources, sinks):
+        '''
+        Raises ValueError unless the commodities given by their source and
+        sink node indices are those of the run the state was taken from, in
+        the same order
+        '''
+        if (len(sources) != len(self.sources) or
+                any(source != saved for source, saved in izip(sources, self.sources)) or
+                any(sink != saved for sink, saved in izip(sinks, self.sinks))):
+            raise ValueError('commodities do not match the solver state')
+
+    def continues(self, epsilon, demands):
+        '''
+        Returns True if a run with epsilon and the given demands is the run
+        the state was taken from, so it can carry on where that one stopped
+        '''
+        return (epsilon == self.epsilon and len(demands) == len(self.demands) and
+                all(demand == saved for demand, saved in izip(demands, self.demands)))
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+class FlowResult(tuple):
+    '''
+    Result of maximum_concurrent_flow.  Unpacks like the plain tuple the
+    solver used to return, (shortestPathComputations, phases), with the
+    end state appended when returnState is set.
+
+    Attributes:
+        lambda_          min over commodities of throughput
+        throughput       fraction of its demand, as given to the solver,
+                         routed for each commodity (in the order the
+                         commodities were given); the solver's internal
+                         demand scaling does not show here
+        flow             scaled flow of each edge, in the order the edges
+                         were given (array of doubles)
+        graph            the CSRGraph solved on (flows in edge id order)
+        objective        final D(l) in true units
+        phases           number of phases run
+        shortestPathComputations
+        epsilon, delta
+        dual_bound       best D(l)/alpha(l) upper bound on lambda found by
+                         gap_check, relative to the given demands like
+                         lambda_, or None without gap_check
+        stopped_early    True if gap_check certified the result before the
+                         usual stopping rule
+        timings          seconds spent in 'setup', 'phases' and 'total'
+        state            SolverState at the end of the run, or None
+    '''
+
+    def __new__(cls, values, **attributes):
+        result = tuple.__new__(cls, values)
+        result.__dict__.update(attributes)
+        return result
+
+
 def scale_demands(commodities, scaleFactor):
     ''' Scales each demand commodities by multiplying by scaleFactor
     '''
@@ -43,9 +170,51 @@ def scale_demands(commodities, scaleFactor):
         commodity.demand *= scaleFactor
 
 
+def scale_values(values, scaleFactor):
+    ''' Scales each entry of values (e.g. an array of demands) in place
+    '''
+    for index in xrange(len(values)):
+        values[index] *= scaleFactor
+
+
+def commodity_arrays(graph, commodities):
+    '''
+    Returns (sources, sinks, demands) of commodities, with node indices of
+    graph for endpoints.  The arrays of a CommodityArrays over graph (or a
+    graph with the same nodes) are returned as they are.
+    '''
+    if isinstance(commodities, CommodityArrays) and (commodities.graph is graph or
+                                                     commodities.graph.nodes == graph.nodes):
+        return commodities.sources, commodities.sinks, commodities.demands
+    node_index = graph.node_index
+    sources, sinks, demands = array('l'), array('l'), array('d')
+    for commodity in commodities:
+        sources.append(node_index[commodity.source])
+        sinks.append(node_index[commodity.sink])
+        demands.append(commodity.demand)
+    return sources, sinks, demands
+
+
+def group_by_source(sources):
+    '''
+    Returns {source: array of the positions i with sources[i] == source}
+    '''
+    groups = {}
+    for index, source in enumerate(sources):
+        group = groups.get(source)
+        if group is None:
+            group = groups[source] = array('l')
+        group.append(index)
+    return groups
+
+
 def construct_graph(edges):
     '''
-    Takes in an iterable of edges and constructs a directed graph
+    Takes in an iterable of edges and constructs a directed networkx graph.
+    The solver itself runs on a CSRGraph; this is kept for callers that
+    want the instance in networkx.  The weights are the Edge.length values:
+    None before a solve and only the initial lengths delta / capacity after
+    one, as the final lengths stay in the solver's graph.
     '''
     G = nx.DiGraph()
     for edge in edges:
@@ -56,54 +225,76 @@ def construct_graph(edges):
     return G
 
 
-def get_edges(G, node_path, headTail=False):
-    '''
-    Given a graph G and a list of nodes in a path, this returns the list of
-    edges in that graph
-
-    If headTail is given as True, we return a list of tuples (head, tail, edge)
+def run_shortest_path_commodity(engine, commodity, allSinks=False):
     '''
-    edges = []
-    for idx, head in enumerate(node_path[:-1]):
-        tail = node_path[idx + 1]
-        if headTail: 
-            edges.append((head, tail, G.edge[head][tail]))
-        else:
-            edges.append(G.edge[head][tail])
-    return edges
-
+    Given a DijkstraEngine and commodity, this runs a shortest path from the
+    source of the commodity to the sink of the commodity and returns its
+    edge ids.
 
-def run_shortest_path_commodity(G, commodity, allSinks=False):
-    '''
-    Given a digraph G and commodity, this runs a shortest path from the source
-    of the commodity to the sink of the commodity.
+    If allSinks is given as True, the full shortest path tree from the source
+    is built instead and the engine is returned to read paths from
     '''
-    source, sink = commodity.source, commodity.sink
+    node_index = engine.graph.node_index
+    source = node_index[commodity.source]
 
     if not allSinks:
-        node_path = nx.shortest_path(G, source, sink, weight=LENGTH_ATTRIBUTE)
-        return get_edges(G, node_path)
+        return engine.shortest_path(source, node_index[commodity.sink])
     else:
-        result_map = nx.shortest_path(G, source, target=None, weight=LENGTH_ATTRIBUTE)
-        return result_map
+        engine.run(source)
+        return engine
         
 
-def calculate_alpha(G, commodities):
+def calculate_alpha(engine, commodities, finder=None):
     '''
-    Takes in a digraph and an iterable of commodities, returns the sum of the
-    min cost flows for satisfying these commodity demands independently
+    Takes in a DijkstraEngine and an iterable of commodities, returns the sum
+    of the min cost flows for satisfying these commodity demands independently
 
-    Throws a NetworkXUnfeasible exception if there is no way to satisfy the
+    One shortest path tree is grown per distinct source and distances are
+    read off it directly.  If a ParallelPathFinder is given, the sources are
+    spread over its workers.
+
+    Throws a NetworkXNoPath exception if there is no way to satisfy the
     demands
     '''
+    sources, sinks, demands = commodity_arrays(engine.graph, commodities)
+    return grouped_alpha(engine, group_by_source(sources), sinks, demands, finder)
+
+
+def grouped_alpha(engine, groups, sinks, demands, finder=None):
+    '''
+    calculate_alpha for commodities given as arrays of sink node indices and
+    demands, with groups from group_by_source
+    '''
+    grouped = groups.items()
+    sinkGroups = [(source, [sinks[index] for index in indices])
+                  for source, indices in grouped]
+
+    if finder is not None:
+        distances = finder.distances(sinkGroups)
+    else:
+        distances = [engine.distances(source, groupSinks)
+                     for source, groupSinks in sinkGroups]
+
     total = 0
-    for commodity in commodities:
-        dist_j = sum([edge[LENGTH_ATTRIBUTE]
-                      for edge in run_shortest_path_commodity(G,commodity)])
-        total += commodity.demand * dist_j
+    for (source, indices), dists in zip(grouped, distances):
+        for index, dist_j in zip(indices, dists):
+            total += demands[index] * dist_j
     return total
 
 
+def calculate_primal_lambda(graph, demands, commodityFlow):
+    '''
+    Returns the lambda of the flow in graph made feasible by dividing it by
+    its max congestion, given the demand of each commodity and the unscaled
+    flow routed for it.  This is a lower bound on the optimal lambda.
+    '''
+    congestion = graph.max_congestion()
+    if congestion <= 0:
+        return 0.
+    return min(commodityFlow[index] / demands[index]
+               for index in xrange(len(demands))) / congestion
+
+
 def calculate_delta(num_edges, epsilon):
     '''
     Calculates delta = (m/(1-e)) ^ (-1/e)
@@ -111,6 +302,14 @@ def calculate_delta(num_edges, epsilon):
     return (num_edges / (1 - epsilon)) ** (-1. / epsilon)
 
 
+def calculate_log_delta(num_edges, epsilon):
+    '''
+    Calculates log delta = -log(m/(1-e)) / e, which stays finite when delta
+    itself underflows
+    '''
+    return -log(num_edges / (1 - epsilon)) / epsilon
+
+
 def calculate_epsilon(error):
     '''
     Calculates the largest epsilon such that (1-e) ^ -3 is at most 1+error
@@ -121,37 +320,44 @@ def calculate_epsilon(error):
     return epsilon
 
 
-def calculate_dual_objective(G):
+def calculate_lazy_epsilon(error):
     '''
-    Calculates D(l) = sum c(e)l(e) over all e
+    Calculates the largest epsilon such that (1+e)(1-e) ^ -3 is at most
+    1+error, leaving a factor of 1+e for routing on paths that are within
+    1+e of shortest.  The smaller epsilon means more phases, so lazy_paths
+    only pays off where paths are reused enough: it halves the shortest
+    path computations on larger instances but costs more on tiny ones.
     '''
-    total = 0
+    epsilon = calculate_epsilon(error)
+    while (1 + epsilon) / (1 - epsilon) ** 3 > 1 + error:
+        epsilon *= 0.99
+    return epsilon
 
-    for head in G.edge.iterkeys():
-        for tail, edge_dict in G.edge[head].iteritems():
-            total += edge_dict[LENGTH_ATTRIBUTE] * edge_dict[CAPACITY_ATTRIBUTE]
-    return total
 
+def calculate_dual_objective(graph):
+    '''
+    Calculates D(l) = sum c(e)l(e) over all e
+    '''
+    return graph.dual_objective() * exp(graph.log_scale)
 
-def calculate_z(G, commodities):
+
+def calculate_z(graph, commodities):
     '''
     Calculates Z = min(z_i/d_i) where z_i is the max flow of commodity i
     and d_i is the demand for commodity i
     '''
-    zList = []
-    for commodity in commodities:
-        zList.append(nx.max_flow(G, commodity.source, commodity.sink) / float(commodity.demand))
-    return min(zList)
+    return min_demand_ratio(graph, *commodity_arrays(graph, commodities))
 
 
-def calculate_L(G):
-    lengths = {}
-    for head in G.node.iterkeys():
-        for tail in G.edge[head].iterkeys():
-            lengths[tail] = max(lengths.get(tail, 0),
-                                lengths.get(head, 0) + 1)
+def calculate_L(graph):
+    lengths = [0] * graph.num_nodes
+    tails = graph.tails
+    for head in xrange(graph.num_nodes):
+        for eid in graph.out_edges(head):
+            tail = tails[eid]
+            lengths[tail] = max(lengths[tail], lengths[head] + 1)
 
-    return max(lengths.itervalues())
+    return max(lengths)
 
 
 def calculate_demand_ratios(commodities, demands=None):
@@ -169,206 +375,448 @@ def calculate_demand_ratios(commodities, demands=None):
 def maximum_concurrent_flow(edges, commodities, error=GLOBAL_ERROR,
                             scale_beta=True, returnBeta=False,
                             karakosta=False, multi_route=False, beta_hat=None,
-                            shortestPathComputations=0):
+                            shortestPathComputations=0, objective_refresh=0,
+                            packing=False, lazy_paths=False, log_lengths=False,
+                            parallel=0, state=None, returnState=False,
+                            twoApprox=False, logger=None, monitor=None,
+                            gap_check=0):
     '''
     Takes in an iterable of edges and commodities and calculates the maximum
-    concurrent flow
+    concurrent flow.  Returns a FlowResult, which unpacks as
+    (shortestPathComputations, phases), with the end state appended if
+    returnState is set.
+
+    edges may also be a CSRGraph (e.g. from shared_graph.attach_graph),
+    whose lengths and flows are reset, or an edge_arrays.EdgeArrays, and
+    commodities a commodity_stream.CommodityArrays.  The given demands are
+    never scaled; the phases work on a copy.
+
+    karakosta routes the commodities of a source together, packing along
+    one shared tree (see tree_routing).  lazy_paths keeps routing on paths
+    within 1+epsilon of shortest (see calculate_lazy_epsilon), log_lengths
+    keeps lengths as scaled mantissas (see CSRGraph), and parallel finds
+    the paths of each phase on that many processes (see
+    parallel.route_phase).  lazy_paths cannot be combined with karakosta,
+    packing or multi_route, nor parallel with multi_route or lazy_paths
+    (ValueError).  state continues or warm starts from a SolverState.
+    objective_refresh recomputes D(l) every that many phases.  gap_check
+    stops the run once D(l)/alpha(l) is within 1+error of the lambda of the
+    current flow, checked every that many phases.  Progress goes to logger
+    (LOGGER by default) and, for sampled phases, to monitor (see
+    phase_metrics).  twoApprox only marks the SPC log line of the second
+    step of two_approx or multi_route.
     '''
-    twoApprox = False
-    if shortestPathComputations!=0:
-        twoApprox = True
+    if parallel and (multi_route or lazy_paths):
+        raise ValueError('parallel cannot be combined with multi_route or lazy_paths')
+    if lazy_paths and (karakosta or packing or multi_route):
+        raise ValueError('lazy_paths cannot be combined with karakosta, packing '
+                         'or multi_route')
+    start_time = time.time()
+    logger = logger or LOGGER
     #calculate parameters
-    epsilon = calculate_epsilon(error)
-    delta = calculate_delta(len(edges), epsilon)
-    print "Epislon, Delta: ", epsilon, delta
+    if lazy_paths or parallel:
+        epsilon = calculate_lazy_epsilon(error)
+    else:
+        epsilon = calculate_epsilon(error)
+    #construct graph; lengths, capacities and flows live in its arrays
+    if isinstance(edges, CSRGraph):
+        graph, edges = edges, None
+    elif isinstance(edges, EdgeArrays):
+        graph, edges = CSRGraph(edges), None
+    else:
+        graph = CSRGraph(edges)
+    # commodities as node index arrays; demands is a copy the scaling below
+    # works on, so givenDemands (the caller's) are left alone and results
+    # are reported relative to them
+    sources, sinks, givenDemands = commodity_arrays(graph, commodities)
+    demands = array('d', givenDemands)
+    numCommodities = len(demands)
+
+    log_delta = calculate_log_delta(graph.num_edges, epsilon)
+    delta = exp(log_delta)
+    logger.info('epsilon %s, delta %s', epsilon, delta)
 
     #set initial edge lengths
-    for edge in edges:
-        edge.length = delta / edge.capacity
+    if edges is not None:
+        for edge in edges:
+            edge.length = delta / edge.capacity
+    engine = DijkstraEngine(graph)
+    resumed = False
+    warm_bound = None  # upper bound on lambda from the lengths of state
+    if state is not None:
+        state.check(sources, sinks)
+        resumed = state.continues(epsilon, givenDemands)
+        shortestPathComputations += state.shortestPathComputations
+        graph.restore(state.length, state.flow, state.log_scale)
+        if not resumed:
+            groups = group_by_source(sources)
+            warm_bound = graph.dual_objective() / grouped_alpha(engine, groups, sinks,
+                                                                givenDemands)
+            shortestPathComputations += len(groups)
+    if not resumed:
+        if log_lengths:
+            graph.reset_log(log_delta)
+        else:
+            graph.reset(delta)
+    timer = None
+    if monitor is not None:
+        if not isinstance(monitor, PhaseMonitor):
+            monitor = PhaseMonitor(monitor)
+        timer = PhaseTimer(graph)
+    # the search objects are only wrapped for timing on sampled phases, so
+    # the other phases run without the clock reads
+    pathEngine, timedEngine = engine, timed(engine, timer)
+    capacity, length, flow = graph.capacity, graph.length, graph.flow
 
-    #construct graph
-    G = construct_graph(edges)
-    
     if multi_route:
-        L = calculate_L(G)
+        enumerator = BoundedPathEnumerator(graph)
+        phaseEnumerator, timedEnumerator = enumerator, timed(enumerator, timer)
+        L = calculate_L(graph)
         total_flow = 0
 
     #calculate z and scale demands
+    demand_scale = 1.
+    if resumed and state.scaled:
+        demand_scale = state.demand_scale
+        scale_values(demands, demand_scale)
+    elif scale_beta:
+        z = min_demand_ratio(graph, sources, sinks, demands)  # z is minimum of shortest paths
+        if z <= 0:
+            raise nx.NetworkXUnfeasible('some commodity has no path to its sink')
+        k = float(numCommodities)  # k is number of commodities
+        # every ratio z_i/d_i is divided by z/k, so the new z is exactly k
+        scale_values(demands, z/k)
+        demand_scale = z/k
     if scale_beta:
-        z = calculate_z(G, commodities)  # z is minimum of shortest paths
-        k = float(len(commodities))  # k is number of commodities
-        t = 2 * (1. / epsilon) * log(len(edges) / (1 - epsilon)) / log(1 + epsilon)
+        t = 2 * (1. / epsilon) * log(graph.num_edges / (1 - epsilon)) / log(1 + epsilon)
         t = int(t)  # t is iteration threshold
-        scale_demands(commodities, z/k)  # so z/k is 1
-        z = calculate_z(G, commodities)
-        assert (abs(1 - z/k) < FP_ERROR_MARGIN)
     
     count = -1
+    # flow routed for each commodity so far, unscaled like the edge flows
+    commodityFlow = [0.] * numCommodities
+    if resumed:
+        count = state.phases
+        commodityFlow = list(state.commodityFlow)
     #start iterations
     
-    # group commodities by source if karakosta
+    # a warm start that does not resume its run checks the gap against the
+    # bound from the saved lengths
+    if warm_bound is not None and not gap_check:
+        gap_check = WARM_GAP_CHECK
+
+    # positions of the commodities of each source, for the grouped phases
+    # and for alpha
+    if karakosta or packing or gap_check or returnBeta:
+        indicesGroupedBySource = group_by_source(sources)
+
     if karakosta:
-        commoditySourceMap = set()  # collects all possible sources
-        for commodity in commodities:
-            commoditySourceMap.add(commodity.source)
-
-        commoditiesGroupedBySource, defaultDemandRatios = {}, {}
-        for commoditySource in commoditySourceMap:
-            commoditySourceList = [commodity for commodity in commodities
-                                   if commodity.source == commoditySource]
-            defaultDemandRatios[commoditySource] = calculate_demand_ratios(commoditySourceList)
-            commoditiesGroupedBySource[commoditySource] = commoditySourceList
-
-    old_objective = -1
-    while True:  # phases
-        current_objective = calculate_dual_objective(G)
-        if current_objective >= 1 and not multi_route:
-            break
-
-        if old_objective >= calculate_dual_objective(G):
-            break
+        defaultDemandRatios = {}
+        for source, indices in indicesGroupedBySource.iteritems():
+            defaultDemandRatios[source] = calculate_demand_ratios(
+                indices, [demands[index] for index in indices])
+
+    if packing:
+        router = SourceTreeRouter(engine)
+
+    # lengths only grow, so the length of a path when it was found bounds
+    # the distance from below, and the path is kept while it stays within
+    # 1+epsilon of that
+    if lazy_paths:
+        lastPaths, pathBounds = {}, {}  # keyed by commodity position
+
+    # best certified bounds on lambda, see gap_check: the lambda of the flow
+    # scaled to feasibility from below, D(l)/alpha(l) from above.  Each check
+    # costs a tree per source, and flows of a run stopped by it are scaled
+    # by their max congestion
+    primal_bound, dual_bound = 0., float('inf')
+    if warm_bound is not None:
+        dual_bound = warm_bound
+    stopped_early = False
+
+    if parallel:
+        if karakosta or packing:
+            parallelIndices = indicesGroupedBySource.values()
         else:
-            old_objective = current_objective
-
-        count += 1 
-        if count % 1000 == 0:
-            print count, current_objective
+            parallelIndices = [[index] for index in xrange(numCommodities)]
+        parallelGroups = [(sources[indices[0]], [sinks[index] for index in indices])
+                          for indices in parallelIndices]
+        finder = ParallelPathFinder(graph, parallel)
+        phaseFinder, timedFinder = finder, timed(finder, timer)
+
+    phases_time = time.time()
+    old_objective = float('-inf')
+    try:
+        while True:  # phases
+            sampled = monitor is not None and monitor.sampled(count + 1)
+            if sampled:
+                timer.start(shortestPathComputations)
+                pathEngine = timedEngine
+            else:
+                pathEngine = engine
+            if packing:
+                router.engine = pathEngine
+            if multi_route:
+                phaseEnumerator = timedEnumerator if sampled else enumerator
+            if parallel:
+                phaseFinder = timedFinder if sampled else finder
+            if log_lengths and graph.renormalise() and lazy_paths:
+                lastPaths.clear()  # cached bounds are in the old scale
+            if sampled:
+                timer.start_objective()
+            if objective_refresh and count % objective_refresh == objective_refresh - 1:
+                graph.refresh_objective()
+            current_objective = graph.log_objective()  # log D(l)
+            if sampled:
+                timer.stop_objective()
+            if current_objective >= 0 and not multi_route:
+                break
+
+            if old_objective >= current_objective:
+                break
+            else:
+                old_objective = current_objective
+
+            count += 1 
+            if count % 1000 == 0:
+                logger.info('phase %d, D(l) %s', count, exp(current_objective))
             
-        if scale_beta and count % t == 0:  # for scaling
-            scale_demands(commodities, 2)
+            if scale_beta and count % t == 0:  # for scaling
+                scale_values(demands, 2)
+                demand_scale *= 2
         
-        # if we grouped commodities by source
-        if karakosta:
-            for source, comList in commoditiesGroupedBySource.iteritems():
-                repElement = comList[0]
-                pathMap = run_shortest_path_commodity(G, repElement, allSinks=True)
-                shortestPathComputations += 1
-                demandRatios = defaultDemandRatios[source][:]
-                demandRemaining = [com.demand for com in comList]
-                tempFlowAdd = {}
-
-                if len(comList) == 1:
-                    d_j = repElement.demand
-                    while d_j > 0:
-                        sp = get_edges(G,pathMap[repElement.sink])
+            if parallel:
+                groupDemands = [[demands[index] for index in indices]
+                                for indices in parallelIndices]
+                flows = [[0.] * len(indices) for indices in parallelIndices]
+                shortestPathComputations += route_phase(phaseFinder, parallelGroups,
+                                                        groupDemands, epsilon,
+                                                        FP_ERROR_MARGIN, flows)
+                for indices, groupFlows in zip(parallelIndices, flows):
+                    for index, added_flow in zip(indices, groupFlows):
+                        commodityFlow[index] += added_flow
+
+            # if we grouped commodities by source
+            elif karakosta:
+                for source, indices in indicesGroupedBySource.iteritems():
+                    pathEngine.run(source)
+                    shortestPathComputations += 1
+
+                    if len(indices) == 1:
+                        index = indices[0]
+                        d_j = demands[index]
+                        sp = pathEngine.path(sinks[index])
+                        min_cap = graph.min_capacity(sp)
+                        while d_j > 0:
+                            added_flow = min(min_cap,d_j)
+                            d_j -= added_flow
+                            commodityFlow[index] += added_flow
+                            graph.augment(sp, added_flow, epsilon)
+                        continue
+
+                    demandRatios = defaultDemandRatios[source][:]
+                    demandRemaining = [demands[index] for index in indices]
+                    paths = [pathEngine.path(sinks[index]) for index in indices]
+                    minCaps = [graph.min_capacity(path) for path in paths]
+                    routed = [0.] * len(indices)
+                    while True:
+                        for position in xrange(len(paths)):  # for every commodity that shares a source
+                            ratio = demandRatios[position]
+                            added_flow = ratio * min(demandRemaining[position], minCaps[position])  # scale min_cap by the ratio
+                            routed[position] += added_flow
+                            demandRemaining[position] -= added_flow
+                        demandRatios = calculate_demand_ratios(indices, demandRemaining)
+                        if max(demandRemaining) <= FP_ERROR_MARGIN: break  # all remaining demands effectively 0
+                    for index, added_flow in zip(indices, routed):
+                        commodityFlow[index] += added_flow
+
+                    # paths are fixed for the phase, so total the flow per edge
+                    # once and apply it in a single batch
+                    tempFlowAdd = {}
+                    for path, added_flow in zip(paths, routed):
+                        for eid in path:
+                            tempFlowAdd[eid] = tempFlowAdd.get(eid, 0) + added_flow
+                    graph.route(tempFlowAdd.keys(), tempFlowAdd.values(), epsilon)
+
+            elif packing:
+                for source, indices in indicesGroupedBySource.iteritems():
+                    groupSinks = [sinks[index] for index in indices]
+                    groupDemands = [demands[index] for index in indices]
+                    flows = [0.] * len(indices)
+                    shortestPathComputations += router.route(source, groupSinks, groupDemands,
+                                                             epsilon, FP_ERROR_MARGIN, flows)
+                    for index, added_flow in zip(indices, flows):
+                        commodityFlow[index] += added_flow
+
+            elif multi_route:
+
+                for index in xrange(numCommodities):
+                    demand = demands[index]
+
+                    log_max_length = log(L) + log_delta + epsilon * total_flow / beta_hat
+                    if log_max_length >= 0:
+                        break
+                    max_length = exp(log_max_length - graph.log_scale)  # in scaled units
+
+                    # collected before routing so every path is checked against
+                    # the lengths at the start of the commodity
+                    paths = list(phaseEnumerator.paths(sources[index], sinks[index], max_length))
+                    shortestPathComputations += 1
+
+                    for idx, path in enumerate(paths):
+                        min_cap = graph.min_capacity(path)
+                        added_flow = min_cap * demand
+                        total_flow += added_flow
+                        commodityFlow[index] += added_flow
+                        graph.augment(path, added_flow, epsilon)
+
+
+            else:  # if not karakosta, packing or multi_route
+                for index in xrange(numCommodities):  # iterations
+                    source, sink = sources[index], sinks[index]
+                    d_j = demands[index]
 
-                        min_cap = min([edge[CAPACITY_ATTRIBUTE] for edge in sp])
-                        added_flow = min(min_cap,d_j)
+                    while d_j > 0:
+                        if lazy_paths:
+                            sp = lastPaths.get(index)
+                            if sp is None or graph.path_length(sp) > pathBounds[index]:
+                                sp = pathEngine.shortest_path(source, sink)
+                                shortestPathComputations +=1
+                                lastPaths[index] = sp
+                                pathBounds[index] = graph.path_length(sp) * (1 + epsilon)
+                        else:
+                            sp = pathEngine.shortest_path(source, sink)
+                            shortestPathComputations +=1
+                        min_cap = graph.min_capacity(sp)
+                        added_flow = min(min_cap, d_j)
                         d_j -= added_flow
-                        for edge in sp:
-                            edge[FLOW_ATTRIBUTE] = edge.get(FLOW_ATTRIBUTE, 0) + added_flow
-                            edge[LENGTH_ATTRIBUTE] = edge[LENGTH_ATTRIBUTE] * (1 + epsilon * added_flow / edge[CAPACITY_ATTRIBUTE])
-                    continue
-
-                while True:
-                    for index, commodity in enumerate(comList):  # for every commodity that shares a source
-                        edgeList = get_edges(G,pathMap[commodity.sink],headTail = True)
-
-                        ratio = demandRatios[index]
-                        min_cap = min([edge_dict[CAPACITY_ATTRIBUTE] for head,tail,edge_dict in edgeList])  # select the minimum capacity from the edges
-                        added_flow = ratio * min(demandRemaining[index], min_cap)  # scale min_cap by the ratio
-                        for head, tail, edgeDict in edgeList:
-                            edgeDict[FLOW_ATTRIBUTE] = edgeDict.get(FLOW_ATTRIBUTE, 0) + added_flow
-                            tempFlowAdd[(head, tail)]= tempFlowAdd.get((head, tail), 0) + added_flow
-                        demandRemaining[index] -= added_flow
-                    demandRatios = calculate_demand_ratios(comList, demandRemaining)
-                    if max(demandRemaining) <= FP_ERROR_MARGIN: break  # all remaining demands effectively 0
-
-                for identifier, flow in tempFlowAdd.iteritems():
-                    head, tail = identifier
-                    edge = G.edge[head][tail]
-                    edge[LENGTH_ATTRIBUTE] = edge[LENGTH_ATTRIBUTE] * (1 + epsilon * flow / edge[CAPACITY_ATTRIBUTE])
-
-        elif multi_route:
-
-            for commodity in commodities:
-                source, sink, demand = commodity.source, commodity.sink, commodity.demand
-
-                max_length = L * delta * e ** (epsilon * total_flow / beta_hat)
-                if max_length >= 1:
+                        commodityFlow[index] += added_flow
+                        graph.augment(sp, added_flow, epsilon)
+
+            if sampled:
+                monitor.record(timer.stats(count, shortestPathComputations,
+                                           monitor.congestion))
+
+            if gap_check and count % gap_check == gap_check - 1:
+                # D(l) and alpha are both in scaled units, so the scale
+                # cancels; alpha of the given demands keeps both bounds
+                # relative to those
+                dual_bound = min(dual_bound, graph.dual_objective() /
+                                 grouped_alpha(engine, indicesGroupedBySource, sinks,
+                                               givenDemands, phaseFinder if parallel else None))
+                shortestPathComputations += len(indicesGroupedBySource)
+                primal_bound = calculate_primal_lambda(graph, givenDemands, commodityFlow)
+                logger.info('phase %d, lambda in [%s, %s]', count, primal_bound, dual_bound)
+                if dual_bound <= (1 + error) * primal_bound:
+                    stopped_early = True
                     break
 
-                all_paths = nx.all_simple_paths(G, source, sink)
-                shortestPathComputations += 1
-                paths = [get_edges(G, path) for path in all_paths]
-                paths = filter(lambda path: sum([edge[LENGTH_ATTRIBUTE] for edge in path]) <= max_length, paths)
-
-                for idx, path in enumerate(paths):
-                    min_cap = min([edge[CAPACITY_ATTRIBUTE] for edge in path])
-                    added_flow = min_cap * demand
-                    total_flow += added_flow
-
-                    for edge in path:
-                        edge[FLOW_ATTRIBUTE] = edge.get(FLOW_ATTRIBUTE, 0) + added_flow
-                        edge[LENGTH_ATTRIBUTE] = edge[LENGTH_ATTRIBUTE] * (1 + epsilon * added_flow / edge[CAPACITY_ATTRIBUTE])
-
-
-        else:  # if not karakosta and multi_route
-            for commodity in commodities:  # iterations
-                d_j = commodity.demand
-
-                while d_j > 0:
-                    sp = run_shortest_path_commodity(G, commodity)
-                    shortestPathComputations +=1
-                    min_cap = min([edge[CAPACITY_ATTRIBUTE] for edge in sp])
-                    added_flow = min(min_cap, d_j)
-                    d_j -= added_flow
-                    for edge in sp:
-                        edge[FLOW_ATTRIBUTE] = edge.get(FLOW_ATTRIBUTE, 0) + added_flow
-                        edge[LENGTH_ATTRIBUTE]= edge[LENGTH_ATTRIBUTE] * (1 + epsilon * added_flow / edge[CAPACITY_ATTRIBUTE])
-
-                
-    if returnBeta:  # returns beta value, not edge_dict, used in 2-approx
-        return shortestPathComputations, calculate_dual_objective(G) / calculate_alpha(G, commodities)
-
-    if multi_route:
+        end_time = time.time()
+        if returnBeta:  # returns beta value, not edge_dict, used in 2-approx
+            # D(l) and alpha are both in scaled units, so the scale cancels
+            beta = graph.dual_objective() / grouped_alpha(engine, indicesGroupedBySource,
+                                                          sinks, givenDemands,
+                                                          finder if parallel else None)
+    finally:
+        # also on errors, so no pool workers are left running
+        if parallel:
+            finder.close()
+
+    if returnState:
+        endState = SolverState(graph, log_delta, epsilon, count, demand_scale,
+                               sources, sinks, givenDemands, shortestPathComputations,
+                               commodityFlow,
+                               scaled=scale_beta or demand_scale != 1.)
+
+    if returnBeta:
+        if returnState:
+            return shortestPathComputations, beta, endState
+        return shortestPathComputations, beta
+
+    if multi_route or resumed or stopped_early:
         # scale by max capacity/flow ratio
-        ratios = []
-        for head, datum in G.edge.iteritems():
-            for tail, edge_dict in datum.iteritems():
-                ratios.append(float(edge_dict.get(FLOW_ATTRIBUTE, 0) / edge_dict[CAPACITY_ATTRIBUTE]))
-        ratio = 1. / max(ratios)
-
-        for head, datum in G.edge.iteritems():
-            for tail, edge_dict in datum.iteritems():
-                edge_dict[FLOW_ATTRIBUTE] = edge_dict.get(FLOW_ATTRIBUTE, 0) * ratio
+        flowScale = 1. / graph.max_congestion()
 
     else:
         # scale by log_(1+e) (1+e)
-        for head in G.edge.iterkeys():
-            for tail, edge_dict in G.edge[head].iteritems():
-                edge_dict[FLOW_ATTRIBUTE] = edge_dict.get(FLOW_ATTRIBUTE, 0) / (log(1. / delta) / log(1 + epsilon))
-
-    commodityTable = {}
-    for commodity in commodities:
-        commodityTable[commodity] = 0
-    for head in G.edge.iterkeys():
-        for tail, edge_dict in G.edge[head].iteritems():
-            for commodity in commodities:
-                if tail == commodity.sink: 
-                    commodityTable[commodity]+=edge_dict[FLOW_ATTRIBUTE]/commodity.demand
-            
-    print "Lambda is " + str( min([x for x in commodityTable.itervalues()]))
-    print "OBJECTIVE: ", calculate_dual_objective(G)
-    print "SPC-"+str(karakosta)+"-"+str(twoApprox)+ " for G(" + str(len(G.node.keys()))+","+str(len(edges))+") w/ error " + str(error)+ ": " + str(shortestPathComputations)
-    for node in G.node.iterkeys():
-        print node, G.edge[node]
-    return shortestPathComputations,count
-
-
-def get_beta_hat(edges, commodities, error=GLOBAL_ERROR, karakosta=True):
-    spc, beta_hat = maximum_concurrent_flow(edges, commodities, error=1., returnBeta=True, karakosta=karakosta,
-                                            scale_beta=False)
+        flowScale = log(1 + epsilon) / -log_delta
+    graph.scale_flows(flowScale)
+
+    # fraction of its demand each commodity gets through
+    throughput = [flowScale * commodityFlow[index] / givenDemands[index]
+                  for index in xrange(numCommodities)]
+
+    lambda_ = min(throughput)
+    objective = calculate_dual_objective(graph)
+    logger.info('Lambda is %s', lambda_)
+    logger.info('OBJECTIVE: %s', objective)
+    logger.info('SPC-%s-%s for G(%d,%d) w/ error %s: %d', karakosta, twoApprox,
+                graph.num_nodes, graph.num_edges, error, shortestPathComputations)
+    if logger.isEnabledFor(logging.DEBUG):
+        for u, node in enumerate(graph.nodes):
+            logger.debug('%s %s', node, dict((graph.nodes[graph.tails[eid]],
+                                              {CAPACITY_ATTRIBUTE: capacity[eid],
+                                               LENGTH_ATTRIBUTE: length[eid] * exp(graph.log_scale),
+                                               FLOW_ATTRIBUTE: flow[eid]})
+                                             for eid in graph.out_edges(u)))
+
+    values = (shortestPathComputations, count)
+    if returnState:
+        values += (endState,)
+    finish_time = time.time()
+    return FlowResult(values, lambda_=lambda_, throughput=throughput,
+                      flow=array('d', (flow[eid] for eid in graph.edge_ids)),
+                      graph=graph, objective=objective, phases=count,
+                      shortestPathComputations=shortestPathComputations,
+                      epsilon=epsilon, delta=delta,
+                      dual_bound=dual_bound if gap_check else None,
+                      stopped_early=stopped_early,
+                      timings={'setup': phases_time - start_time,
+                               'phases': end_time - phases_time,
+                               'total': finish_time - start_time},
+                      state=endState if returnState else None)
+
+
+def get_beta_hat(edges, commodities, error=GLOBAL_ERROR, karakosta=True, returnState=False):
+    '''
+    Returns (beta_hat, spc) from a coarse error=1 run, or with returnState
+    (beta_hat, spc, state), state letting the real run bound lambda with its
+    lengths
+    '''
+    if returnState:
+        spc, beta_hat, state = maximum_concurrent_flow(edges, commodities, error=1., returnBeta=True,
+                                                       karakosta=karakosta, scale_beta=False,
+                                                       returnState=True)
+        return beta_hat, spc, state
+    spc, beta_hat = maximum_concurrent_flow(edges, commodities, error=1., returnBeta=True,
+                                            karakosta=karakosta, scale_beta=False)
     return beta_hat, spc
 
 
-def two_approx(edges, commodities, error=GLOBAL_ERROR, karakosta=True):
-    beta_hat, spc = get_beta_hat(edges, commodities, error=1., returnBeta=True, karakosta=karakosta)
+def two_approx(edges, commodities, error=GLOBAL_ERROR, karakosta=True, warm_start=False):
+    '''
+    With warm_start=True the run is given the state of the beta_hat run, so
+    it can stop once its lambda is certified against the bound from those
+    lengths (see SolverState)
+    '''
+    state = None
+    if warm_start:
+        beta_hat, spc, state = get_beta_hat(edges, commodities, karakosta=karakosta,
+                                            returnState=True)
+        spc = 0  # counted in the state
+    else:
+        beta_hat, spc = get_beta_hat(edges, commodities, karakosta=karakosta)
     scale_demands(commodities, beta_hat / 2.)
-    return maximum_concurrent_flow(edges, commodities, error=error, karakosta=karakosta, shortestPathComputations=spc)
-
-def multi_route(edges, commodities, error=GLOBAL_ERROR, scale_beta=True, karakosta=False):
-    beta_hat, spc = get_beta_hat(edges, commodities, error=1.)
     return maximum_concurrent_flow(edges, commodities, error=error, karakosta=karakosta, shortestPathComputations=spc,
-                                   scale_beta=scale_beta, multi_route=True, beta_hat=beta_hat)
-
+                                   state=state, twoApprox=True)
+
+def multi_route(edges, commodities, error=GLOBAL_ERROR, scale_beta=True, karakosta=False,
+                warm_start=False):
+    state = None
+    if warm_start:
+        beta_hat, spc, state = get_beta_hat(edges, commodities, returnState=True)
+        spc = 0  # counted in the state
+    else:
+        beta_hat, spc = get_beta_hat(edges, commodities)
+    return maximum_concurrent_flow(edges, commodities, error=error, karakosta=karakosta, shortestPathComputations=spc,
+                                   scale_beta=scale_beta, multi_route=True, beta_hat=beta_hat, state=state,
+                                   twoApprox=True)
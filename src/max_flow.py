@@ -0,0 +1,193 @@
+'''
+Dinic max flow over the arrays of a CSRGraph, used to compute z for demand
+scaling.  Residual arcs are numbered so that arc e is edge e in its own
+direction and arc e + m is edge e reversed; pushing flow on one arc frees the
+same amount on its partner.
+'''
+from array import array
+
+
+# residual capacities at or below this count as saturated
+EPS = 1e-12
+
+
+class DinicMaxFlow(object):
+    '''
+    Reusable Dinic solver: the residual arc structure is built once per graph
+    and every max_flow call only resets the residual capacities.
+    '''
+
+    def __init__(self, graph):
+        n, m = graph.num_nodes, graph.num_edges
+        heads, tails = graph.heads, graph.tails
+        self.graph = graph
+
+        # arcs leaving u: its out edges forwards, then its in edges backwards
+        arc_offsets = [0] * (n + 1)
+        for eid in xrange(m):
+            arc_offsets[heads[eid] + 1] += 1
+            arc_offsets[tails[eid] + 1] += 1
+        for u in xrange(n):
+            arc_offsets[u + 1] += arc_offsets[u]
+        position = arc_offsets[:-1]
+        arcs, target = [0] * (2 * m), [0] * (2 * m)
+        for eid in xrange(m):
+            u, v = heads[eid], tails[eid]
+            arcs[position[u]] = eid
+            position[u] += 1
+            arcs[position[v]] = eid + m
+            position[v] += 1
+            target[eid] = v
+            target[eid + m] = u
+
+        self.num_edges = m
+        self.arc_offsets = array('l', arc_offsets)
+        self.arcs = array('l', arcs)
+        self.target = array('l', target)
+        self.residual = array('d', [0.]) * (2 * m)
+        self.level = array('l', [-1]) * n
+        self.current = array('l', [0]) * n
+        self.queue = array('l', [0]) * n
+
+    def max_flow(self, source, sink, limit=float('inf')):
+        '''
+        Returns the value of a maximum source-sink flow, or a value of at
+        least limit if the flow reaches limit first.
+
+        If the returned value is below limit, in_source_side(v) afterwards
+        tells which side of a minimum cut node v is on.
+        '''
+        m, capacity, residual = self.num_edges, self.graph.capacity, self.residual
+        for eid in xrange(m):
+            residual[eid] = capacity[eid]
+            residual[eid + m] = 0.
+
+        total = 0.
+        while self._levels(source, sink):
+            arc_offsets, current = self.arc_offsets, self.current
+            for u in xrange(len(current)):
+                current[u] = arc_offsets[u]
+            while True:
+                pushed = self._augment(source, sink, limit - total)
+                if not pushed:
+                    break
+                total += pushed
+                if total >= limit:
+                    return total
+        return total
+
+    def in_source_side(self, node):
+        return self.level[node] >= 0
+
+    def _levels(self, source, sink):
+        '''
+        Breadth first search over arcs with residual capacity; returns
+        whether sink is reachable
+        '''
+        arc_offsets, arcs, target, residual = (self.arc_offsets, self.arcs,
+                                               self.target, self.residual)
+        level, queue = self.level, self.queue
+        for u in xrange(len(level)):
+            level[u] = -1
+        level[source] = 0
+        queue[0] = source
+        head, tail = 0, 1
+        while head < tail:
+            u = queue[head]
+            head += 1
+            next_level = level[u] + 1
+            for idx in xrange(arc_offsets[u], arc_offsets[u + 1]):
+                arc = arcs[idx]
+                v = target[arc]
+                if level[v] < 0 and residual[arc] > EPS:
+                    level[v] = next_level
+                    queue[tail] = v
+                    tail += 1
+        return level[sink] >= 0
+
+    def _augment(self, source, sink, limit):
+        '''
+        Finds one path in the level graph using the current arc pointers and
+        pushes as much flow as possible (up to limit) along it
+        '''
+        m = self.num_edges
+        arc_offsets, arcs, target, residual = (self.arc_offsets, self.arcs,
+                                               self.target, self.residual)
+        level, current = self.level, self.current
+        path = []
+        u = source
+        while u != sink:
+            end = arc_offsets[u + 1]
+            idx = current[u]
+            while idx < end:
+                arc = arcs[idx]
+                v = target[arc]
+                if residual[arc] > EPS and level[v] == level[u] + 1:
+                    break
+                idx += 1
+            current[u] = idx
+            if idx < end:
+                path.append(arc)
+                u = v
+                continue
+            # dead end: retreat and skip the arc that led here
+            if u == source:
+                return 0.
+            arc = path.pop()
+            u = target[arc + m if arc < m else arc - m]
+            current[u] += 1
+
+        pushed = limit
+        for arc in path:
+            pushed = min(pushed, residual[arc])
+        for arc in path:
+            residual[arc] -= pushed
+            residual[arc + m if arc < m else arc - m] += pushed
+        return pushed
+
+
+def min_demand_ratio(graph, sources, sinks, demands):
+    '''
+    Returns min over i of maxflow(sources[i], sinks[i]) / demands[i], with
+    node indices for endpoints.
+
+    Every commodity is solved, in increasing order of a cheap upper bound
+    on its ratio so that a small best is found early.  Each max flow is
+    capped at the value that would tie best, since a commodity reaching it
+    cannot lower the minimum.  When a max flow from a source completes, its
+    minimum cut separates the source from every sink on the sink side too,
+    so its value also caps the max flow of those commodities.  Upper bounds
+    only ever lower these caps; they never rule a commodity out.
+    '''
+    n, m = graph.num_nodes, graph.num_edges
+    heads, tails, capacity = graph.heads, graph.tails, graph.capacity
+    out_capacity, in_capacity = [0.] * n, [0.] * n
+    for eid in xrange(m):
+        out_capacity[heads[eid]] += capacity[eid]
+        in_capacity[tails[eid]] += capacity[eid]
+
+    # caps[i] is an upper bound on the max flow of commodity i
+    caps = [min(out_capacity[source], in_capacity[sink])
+            for source, sink in zip(sources, sinks)]
+    bySource = {}
+    for idx, source in enumerate(sources):
+        bySource.setdefault(source, []).append(idx)
+
+    solver = DinicMaxFlow(graph)
+    order = sorted(xrange(len(caps)), key=lambda idx: caps[idx] / float(demands[idx]))
+    best = float('inf')
+    for idx in order:
+        source, demand = sources[idx], float(demands[idx])
+        cap = min(best * demand, caps[idx])
+        flow = solver.max_flow(source, sinks[idx], cap)
+        if flow >= best * demand:
+            continue
+        best = flow / demand
+        if flow >= cap:
+            continue  # stopped at caps[idx], so no minimum cut to reuse
+
+        # the cut just found also bounds every sink of this source behind it
+        for other in bySource[source]:
+            if not solver.in_source_side(sinks[other]):
+                caps[other] = min(caps[other], flow)
+    return best
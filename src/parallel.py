@@ -0,0 +1,166 @@
+'''
+Process pool for computing the shortest paths of a phase in parallel.
+
+Workers are forked with a copy of the CSRGraph topology and their own
+DijkstraEngine.  Edge lengths are published to them through a shared memory
+array, so each round only costs one memcpy of the length vector per worker
+instead of pickling the graph.
+'''
+from multiprocessing import Pool
+from multiprocessing.sharedctypes import RawArray
+import ctypes
+
+from dijkstra import DijkstraEngine
+
+
+# state of a forked worker, set up once by _init_worker
+_worker = {}
+
+
+def _copy_lengths(destination, source, num_bytes):
+    ctypes.memmove(destination, source, num_bytes)
+
+
+def _init_worker(graph, shared):
+    _worker['graph'] = graph
+    _worker['engine'] = DijkstraEngine(graph)
+    _worker['shared'] = shared
+
+
+def _refresh_worker():
+    graph, shared = _worker['graph'], _worker['shared']
+    _copy_lengths(graph.length.buffer_info()[0], ctypes.addressof(shared),
+                  graph.num_edges * graph.length.itemsize)
+    return _worker['engine']
+
+
+def _worker_paths(groups):
+    '''
+    Runs in a worker: refreshes the local lengths from shared memory, then
+    returns a list of paths per (source, sinks) group
+    '''
+    engine = _refresh_worker()
+    return [find_paths(engine, source, sinks) for source, sinks in groups]
+
+
+def _worker_distances(groups):
+    '''
+    Like _worker_paths, returning distances instead of paths
+    '''
+    engine = _refresh_worker()
+    return [engine.distances(source, sinks) for source, sinks in groups]
+
+
+def find_paths(engine, source, sinks):
+    '''
+    Returns the shortest paths from source to each of sinks, stopping early
+    when there is only one sink
+    '''
+    if len(sinks) == 1:
+        return [engine.shortest_path(source, sinks[0])]
+    engine.run(source)
+    return [engine.path(sink) for sink in sinks]
+
+
+class ParallelPathFinder(object):
+    '''
+    Computes shortest paths for many (source, sinks) groups at once, all
+    against the lengths of the graph at the time of the call.
+
+    Relies on fork: the graph and the shared length array are inherited by
+    the workers rather than pickled.
+    '''
+
+    def __init__(self, graph, processes):
+        self.graph = graph
+        self.processes = processes
+        self.shared = RawArray(ctypes.c_double, graph.num_edges)
+        self.pool = Pool(processes, _init_worker, (graph, self.shared))
+
+    def paths(self, groups):
+        '''
+        Takes a list of (source, sinks) node index groups and returns, in the
+        same order, the list of shortest paths for each group
+        '''
+        return self._map(_worker_paths, groups)
+
+    def distances(self, groups):
+        '''
+        Like paths, returning the list of shortest path distances per group
+        '''
+        return self._map(_worker_distances, groups)
+
+    def _map(self, function, groups):
+        graph = self.graph
+        _copy_lengths(ctypes.addressof(self.shared), graph.length.buffer_info()[0],
+                      graph.num_edges * graph.length.itemsize)
+
+        # a few chunks per worker to even out uneven tree sizes
+        num_chunks = min(len(groups), 4 * self.processes)
+        chunks = [groups[idx::num_chunks] for idx in xrange(num_chunks)]
+        results = self.pool.map(function, chunks)
+
+        merged = [None] * len(groups)
+        for idx, chunk_results in enumerate(results):
+            merged[idx::num_chunks] = chunk_results
+        return merged
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+
+def route_phase(finder, groups, demands, epsilon, margin, flows=None):
+    '''
+    Routes demands[g][i] from the source of groups[g] to its i-th sink in
+    Jacobi steps: every path of a step is computed in parallel against the
+    lengths at the start of the step, then the combined load is routed and
+    all lengths are updated in one batch.
+
+    Each path is scaled so no edge receives more than its capacity, so no
+    length grows by more than a factor 1+epsilon within a step and every path
+    used is within 1+epsilon of shortest under the lengths it is charged at.
+    That costs one extra 1+epsilon factor in the Garg-Konemann ratio, which
+    the caller pays for by choosing epsilon with calculate_lazy_epsilon.
+
+    Stops once every remaining demand is at most margin and returns the
+    number of shortest path computations made.  If flows is given,
+    flows[g][i] is increased by the amount routed for demands[g][i].
+    '''
+    graph = finder.graph
+    remaining = [list(group_demands) for group_demands in demands]
+    computations = 0
+    while True:
+        active = [idx for idx in xrange(len(groups)) if max(remaining[idx]) > margin]
+        if not active:
+            return computations
+        paths = finder.paths([groups[idx] for idx in active])
+        computations += len(active)
+
+        loads = {}
+        for idx, group_paths in zip(active, paths):
+            for path, amount in zip(group_paths, remaining[idx]):
+                if amount > margin:
+                    for eid in path:
+                        loads[eid] = loads.get(eid, 0) + amount
+
+        # scale each path by its tightest edge's capacity / load ratio, so
+        # no edge gets more than its capacity but paths away from the
+        # bottlenecks are routed in full
+        capacity = graph.capacity
+        routed = {}
+        for idx, group_paths in zip(active, paths):
+            group_remaining = remaining[idx]
+            for sink_idx, path in enumerate(group_paths):
+                amount = group_remaining[sink_idx]
+                if amount <= margin:
+                    continue
+                scale = 1.
+                for eid in path:
+                    scale = min(scale, capacity[eid] / loads[eid])
+                for eid in path:
+                    routed[eid] = routed.get(eid, 0) + scale * amount
+                group_remaining[sink_idx] = amount * (1 - scale)
+                if flows is not None:
+                    flows[idx][sink_idx] += scale * amount
+        graph.route(routed.keys(), routed.values(), epsilon)
@@ -0,0 +1,158 @@
+'''
+Length bounded simple path enumeration for the multi route solver.
+
+Paths are produced by Yen's algorithm in increasing order of length and the
+enumeration stops at the first path longer than the bound, so only the paths
+that will actually be used are ever built.  A reverse shortest path search
+from the sink gives an exact lower bound on the remaining length from every
+node; spur searches use it as an A* heuristic and skip any node, and any spur
+root, that cannot finish within the bound.
+'''
+from array import array
+import heapq
+
+
+class BoundedPathEnumerator(object):
+    '''
+    Enumerates the simple paths of a CSRGraph that are no longer than a
+    bound, shortest first.  The reverse adjacency is built once per graph.
+    '''
+
+    def __init__(self, graph):
+        n, m = graph.num_nodes, graph.num_edges
+        tails = graph.tails
+        in_offsets = [0] * (n + 1)
+        for eid in xrange(m):
+            in_offsets[tails[eid] + 1] += 1
+        for v in xrange(n):
+            in_offsets[v + 1] += in_offsets[v]
+        position = in_offsets[:-1]
+        in_edges = [0] * m
+        for eid in xrange(m):
+            v = tails[eid]
+            in_edges[position[v]] = eid
+            position[v] += 1
+
+        self.graph = graph
+        self.in_offsets = array('l', in_offsets)
+        self.in_edges = array('l', in_edges)
+
+    def paths(self, source, sink, max_length):
+        '''
+        Yields the edge ids of every simple path from node index source to
+        node index sink with length at most max_length, in increasing order
+        of length.  Lengths must not change while the generator is in use.
+        '''
+        graph = self.graph
+        tails, length = graph.tails, graph.length
+        to_sink = self._distances_to(sink, max_length)
+        if source not in to_sink:
+            return
+
+        first = self._spur_path(source, sink, max_length, to_sink, (), ())
+        if first is None:
+            return
+        # edges already taken after each root prefix of an accepted path
+        branches = {}
+        seen = set()
+        candidates = []
+        counter = 0
+        deviation, path = 0, first[1]
+
+        while True:
+            yield path
+            for i in xrange(len(path)):
+                branches.setdefault(tuple(path[:i]), set()).add(path[i])
+
+            # spur nodes before the deviation share their root and banned
+            # edges with the parent path, so their spurs are already queued
+            nodes = [source] + [tails[eid] for eid in path]
+            root_length = sum(length[eid] for eid in path[:deviation])
+            for i in xrange(deviation, len(path)):
+                spur = nodes[i]
+                budget = max_length - root_length
+                if to_sink.get(spur, budget + 1) <= budget:
+                    root = path[:i]
+                    found = self._spur_path(spur, sink, budget, to_sink,
+                                            nodes[:i], branches[tuple(root)])
+                    if found is not None:
+                        spur_path = root + found[1]
+                        key = tuple(spur_path)
+                        if key not in seen:
+                            seen.add(key)
+                            counter += 1
+                            heapq.heappush(candidates, (root_length + found[0],
+                                                        counter, i, spur_path))
+                root_length += length[path[i]]
+
+            if not candidates:
+                return
+            path_length, _, deviation, path = heapq.heappop(candidates)
+            if path_length > max_length:
+                return
+
+    def _distances_to(self, sink, max_length):
+        '''
+        Returns {node: distance to sink} for every node within max_length
+        of sink
+        '''
+        heads, length = self.graph.heads, self.graph.length
+        in_offsets, in_edges = self.in_offsets, self.in_edges
+        dist = {sink: 0.}
+        heap = [(0., sink)]
+        done = set()
+        while heap:
+            dv, v = heapq.heappop(heap)
+            if v in done:
+                continue
+            done.add(v)
+            for idx in xrange(in_offsets[v], in_offsets[v + 1]):
+                eid = in_edges[idx]
+                u = heads[eid]
+                du = dv + length[eid]
+                if du <= max_length and du < dist.get(u, du + 1):
+                    dist[u] = du
+                    heapq.heappush(heap, (du, u))
+        return dist
+
+    def _spur_path(self, start, sink, max_length, to_sink, banned_nodes, banned_edges):
+        '''
+        A* search from start to sink avoiding banned_nodes and banned_edges.
+        Returns (length, edge ids) of the shortest such path, or None if
+        there is none within max_length.
+        '''
+        graph = self.graph
+        offsets, heads, tails, length = (graph.offsets, graph.heads,
+                                         graph.tails, graph.length)
+        banned_nodes = set(banned_nodes)
+        dist = {start: 0.}
+        pred = {start: -1}
+        heap = [(to_sink[start], start)]
+        done = set()
+        while heap:
+            _, u = heapq.heappop(heap)
+            if u in done:
+                continue
+            if u == sink:
+                path = []
+                while u != start:
+                    eid = pred[u]
+                    path.append(eid)
+                    u = heads[eid]
+                path.reverse()
+                return dist[sink], path
+            done.add(u)
+            du = dist[u]
+            for eid in xrange(offsets[u], offsets[u + 1]):
+                v = tails[eid]
+                if v in done or v in banned_nodes or eid in banned_edges:
+                    continue
+                remaining = to_sink.get(v)
+                if remaining is None:
+                    continue  # sink is out of reach from v
+                dv = du + length[eid]
+                if dv + remaining <= max_length and dv < dist.get(v, dv + 1):
+                    dist[v] = dv
+                    pred[v] = eid
+                    heapq.heappush(heap, (dv + remaining, v))
+        return None
@@ -0,0 +1,207 @@
+'''
+Per phase instrumentation of maximum_concurrent_flow.
+
+A PhaseMonitor passed to the solver as monitor receives a PhaseStats after
+every sampled phase: the dual objective, the shortest path computations and
+flow/length updates the phase made, its largest edge congestion and where
+its wall time went.  Shortest path time is measured by wrapping the search
+objects the solver uses (see timed); everything else in a phase outside the
+objective computation is flow and length updates plus bookkeeping.
+
+Only sampled phases are measured: the solver starts the timer and hands out
+the wrapped search objects on those, at two clock reads per search, and runs
+the raw ones otherwise.  The congestion scan is O(m) and also only runs on
+sampled phases, so monitoring every N-th phase with every=N keeps a long run
+about as fast as an unmonitored one.  PhaseMetrics keeps the records
+and writes them as CSV or JSON.
+'''
+import csv
+import json
+from math import exp
+import time
+from types import GeneratorType
+
+
+# search methods whose time is counted as shortest path time
+TIMED_METHODS = ('run', 'shortest_path', 'revalidate', 'paths', 'distances')
+
+FIELDS = ('phase', 'objective', 'log_objective', 'spc', 'augmentations',
+          'max_congestion', 'time', 'shortest_path_time', 'objective_time',
+          'update_time')
+
+
+class PhaseStats(object):
+    '''
+    Statistics of one phase.
+
+    objective and log_objective are D(l) (in true units) after the phase,
+    spc and augmentations count the shortest path computations and the flow
+    and length updates (augment / route calls) it made, and max_congestion
+    is the largest flow / capacity ratio of the unscaled flows after it, or
+    None if it was not measured.  time is the wall time
+    of the phase, split into shortest_path_time, objective_time and
+    update_time (the rest).
+    '''
+
+    __slots__ = ('phase', 'log_objective', 'spc', 'augmentations', 'max_congestion',
+                 'time', 'shortest_path_time', 'objective_time')
+
+    def __init__(self, phase, log_objective, spc, augmentations, max_congestion,
+                 time, shortest_path_time, objective_time):
+        self.phase = phase
+        self.log_objective = log_objective
+        self.spc = spc
+        self.augmentations = augmentations
+        self.max_congestion = max_congestion
+        self.time = time
+        self.shortest_path_time = shortest_path_time
+        self.objective_time = objective_time
+
+    @property
+    def objective(self):
+        return exp(self.log_objective)
+
+    @property
+    def update_time(self):
+        return self.time - self.shortest_path_time - self.objective_time
+
+    def as_dict(self):
+        return dict((field, getattr(self, field)) for field in FIELDS)
+
+
+class PhaseMonitor(object):
+    '''
+    Receives the PhaseStats of every sampled phase.  Calls callback with
+    each if given; subclass and override record to do anything else.
+
+    Phases are sampled when their number is a multiple of every.  With
+    congestion=False the max congestion is never measured.
+    '''
+
+    def __init__(self, callback=None, every=1, congestion=True):
+        self.callback = callback
+        self.every = every
+        self.congestion = congestion
+
+    def sampled(self, phase):
+        return phase % self.every == 0
+
+    def record(self, stats):
+        if self.callback is not None:
+            self.callback(stats)
+
+
+class PhaseMetrics(PhaseMonitor):
+    '''
+    PhaseMonitor that keeps the PhaseStats of every sampled phase in records
+    '''
+
+    def __init__(self, every=1, congestion=True):
+        PhaseMonitor.__init__(self, every=every, congestion=congestion)
+        self.records = []
+
+    def record(self, stats):
+        self.records.append(stats)
+
+    def totals(self):
+        '''
+        Returns the spc, augmentations and times summed over the records
+        '''
+        totals = dict.fromkeys(('spc', 'augmentations', 'time', 'shortest_path_time',
+                                'objective_time', 'update_time'), 0)
+        for stats in self.records:
+            for field in totals:
+                totals[field] += getattr(stats, field)
+        return totals
+
+    def write_csv(self, path):
+        with open(path, 'wb') as f:
+            writer = csv.writer(f)
+            writer.writerow(FIELDS)
+            for stats in self.records:
+                writer.writerow([getattr(stats, field) for field in FIELDS])
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump({'every': self.every, 'totals': self.totals(),
+                       'phases': [stats.as_dict() for stats in self.records]}, f)
+
+
+class PhaseTimer(object):
+    '''
+    Measures the phases of one solver run on graph for a PhaseMonitor
+    '''
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.shortest_paths = 0.  # seconds spent searching in this phase
+        self.phase_start = self.objective_start = 0.
+        self.objective = 0.
+        self.spc = self.augmentations = 0
+
+    def start(self, spc):
+        '''
+        Starts a phase, given the solver's shortest path computation count
+        '''
+        self.phase_start = time.time()
+        self.shortest_paths = self.objective = 0.
+        self.spc = spc
+        self.augmentations = self.graph.augmentations
+
+    def start_objective(self):
+        self.objective_start = time.time()
+
+    def stop_objective(self):
+        self.objective += time.time() - self.objective_start
+
+    def stats(self, phase, spc, congestion=True):
+        '''
+        Returns the PhaseStats of the phase started last, which has made
+        the solver's count of shortest path computations spc
+        '''
+        graph = self.graph
+        max_congestion = graph.max_congestion() if congestion else None
+        return PhaseStats(phase, graph.log_objective(), spc - self.spc,
+                          graph.augmentations - self.augmentations, max_congestion,
+                          time.time() - self.phase_start, self.shortest_paths,
+                          self.objective)
+
+
+class TimedSearches(object):
+    '''
+    Stands in for a search object (DijkstraEngine, ParallelPathFinder,
+    BoundedPathEnumerator) and adds the time spent in its search methods
+    to a PhaseTimer.  Generators are run to the end inside the measurement
+    and returned as lists.
+    '''
+
+    def __init__(self, target, timer):
+        self._target = target
+        for name in TIMED_METHODS:
+            method = getattr(target, name, None)
+            if method is not None:
+                setattr(self, name, self._timed(method, timer))
+
+    @staticmethod
+    def _timed(method, timer):
+        def timed(*args, **kwargs):
+            start = time.time()
+            result = method(*args, **kwargs)
+            if isinstance(result, GeneratorType):
+                result = list(result)
+            timer.shortest_paths += time.time() - start
+            return result
+        return timed
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+
+def timed(target, timer):
+    '''
+    Returns target wrapped to count its search time in timer, or target
+    itself if timer is None
+    '''
+    if timer is None:
+        return target
+    return TimedSearches(target, timer)
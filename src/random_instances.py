@@ -0,0 +1,136 @@
+'''
+Random instances for the experiments: a weakly connected random digraph with
+random capacities and commodities whose sinks are reachable from their
+sources.  Every draw comes from the random module, so seeding it (or passing
+seed to prepare_random_input) makes an instance reproducible.
+
+cached_random_input keeps a library of generated instances on disk, one
+file per (nodes, edges, commodities, distribution, seed), named by a hash
+of that key and written by shared_graph.export_graph.  Later requests map
+the file instead of generating the instance again.  Every sweep, algorithm
+and repeat asking for the same key then solves exactly the same instance,
+and no generation time is spent inside timed runs.
+'''
+import errno
+import hashlib
+import os
+import random
+
+import networkx as nx
+
+from csr_graph import CSRGraph
+from max_concurrent_flow import Commodity
+from max_concurrent_flow import Edge
+from shared_graph import attach_graph
+from shared_graph import export_graph
+
+
+# default directory of the instance library
+INSTANCE_DIR = 'instances'
+
+
+def random_connected_graph(numNodes, numEdges):
+    '''Generates a weakly connected random graph with numNodes nodes
+       and numEdges edges
+    '''
+    tries = 0
+    while tries < 100:
+        tries += 1
+        random_graph = nx.gnm_random_graph(numNodes,numEdges,directed = True)
+        if nx.is_weakly_connected(random_graph): 
+            return random_graph
+    return None
+
+def randomCommodities(random_graph, numCommodities, commodityDistribution = None):
+    '''Generates a list of commodities with reachable source and sink
+       and numCommodity groups numbers of commodities with the same starting source
+    '''
+
+    edgeDict = random_graph.edge
+    nodes = set([key for key in edgeDict.iterkeys()])
+    commodities = []
+    commodityDistribution = commodityDistribution or [1] * numCommodities
+    assert len(commodityDistribution) <= len(nodes)
+    reachable = {}  # one search per source tried
+    for xCommodities in commodityDistribution:
+        done = False
+        while not done:
+            randomChoice = random.sample(nodes, 1)[0]
+            if randomChoice not in reachable:
+                reachable[randomChoice] = nx.descendants(random_graph, randomChoice)
+            possSinks = sorted(reachable[randomChoice])
+            if len(possSinks) < xCommodities:
+                pass
+            else:
+                nodes.remove(randomChoice)
+                sinks = random.sample(possSinks, xCommodities)
+                
+                for sink in sinks:
+                    commodities.append(Commodity(randomChoice, sink, random.randint(1,50)))
+                done = True
+    assert len(commodities) == numCommodities
+    for commodity in commodities:
+        assert(commodity.sink in reachable[commodity.source])
+    return commodities
+
+
+def prepare_random_input(numNodes,numEdges,numCommodities,commodityDistribution=None,
+                         seed=None):
+    '''Returns (edges, commodities) of a random instance, or (None, None) if
+       no weakly connected graph was found.  If seed is given the random
+       module is seeded with it first.
+    '''
+    if seed is not None:
+        random.seed(seed)
+    print "Making random graph"
+    random_graph = random_connected_graph(numNodes,numEdges)
+    if random_graph is None:
+        return None, None
+    print "Finished making random graph\n Making random commodities"
+    commodities = randomCommodities(random_graph, numCommodities, commodityDistribution)
+    print "Finished making random commodities"
+    edgeList = []
+    for head,v in random_graph.edge.iteritems():
+        for tail in v.iterkeys():
+            edgeList.append(Edge(head,tail, random.randint(2,10)))
+    return edgeList, commodities
+
+
+def instance_path(directory, numNodes, numEdges, numCommodities,
+                  commodityDistribution=None, seed=0):
+    '''Returns the path of the library file of an instance'''
+    key = (numNodes, numEdges, numCommodities,
+           list(commodityDistribution) if commodityDistribution else None, seed)
+    return os.path.join(directory, hashlib.md5(repr(key)).hexdigest() + '.mcf')
+
+
+def cached_random_input(numNodes, numEdges, numCommodities, commodityDistribution=None,
+                        seed=0, directory=INSTANCE_DIR):
+    '''Returns (graph, commodities) of the instance prepare_random_input
+       generates from seed, as a CSRGraph mapped from the library in
+       directory and a list of Commodity objects.  The instance is
+       generated and added to the library on first use.  Returns
+       (None, None) if no weakly connected graph was found; that outcome is
+       kept in the library as an empty file.
+    '''
+    path = instance_path(directory, numNodes, numEdges, numCommodities,
+                         commodityDistribution, seed)
+    if not os.path.exists(path):
+        try:
+            os.makedirs(directory)
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                raise
+        edges, commodities = prepare_random_input(numNodes, numEdges, numCommodities,
+                                                  commodityDistribution, seed)
+        # written under a private name and renamed, so concurrent workers
+        # generating the same instance never see a partial file
+        temporary = '%s.%d.tmp' % (path, os.getpid())
+        if edges is None:
+            open(temporary, 'wb').close()
+        else:
+            export_graph(temporary, CSRGraph(edges), commodities)
+        os.rename(temporary, path)
+    if not os.path.getsize(path):
+        return None, None
+    return attach_graph(path, Commodity)
@@ -0,0 +1,231 @@
+'''
+Aggregation and reporting of experiment results.
+
+Results are loaded in bulk into one numpy array per column (ResultArrays),
+from a ResultStore or any iterable of records.  summarise sorts the runs
+once by their group columns and computes count, mean, standard deviation,
+median, percentiles and a 95% confidence interval of the mean of spc,
+iterations and seconds for every group.
+
+Failed runs are kept in the arrays (their metrics are NaN) and counted per
+group.  Statistics cover only the runs that succeeded; a group where every
+run failed has NaN statistics, written as empty CSV fields.
+
+write_table and plot produce the per parameter tables and figures of
+data5 and data6.  Plotting needs matplotlib, imported on first use.
+'''
+import csv
+import json
+from math import sqrt
+
+import numpy as np
+
+from result_store import COLUMNS
+from result_store import GROUP_COLUMNS
+
+
+METRICS = ('spc', 'iterations', 'seconds')
+TEXT_COLUMNS = ('distribution', 'algorithm', 'error', 'source')
+INTEGER_COLUMNS = ('nodes', 'edges', 'commodities', 'repeat', 'seed')
+PERCENTILES = (25, 75)
+
+# two sided 95% Student t quantiles by degrees of freedom; 1.96 beyond
+T_95 = (12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+        2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+        2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042)
+
+
+def t_95(freedom):
+    if freedom <= len(T_95):
+        return T_95[freedom - 1]
+    return 1.96
+
+
+class ResultArrays(object):
+    '''
+    Results as one array per column (see result_store.COLUMNS): numeric
+    columns are float arrays with NaN for missing values, text columns are
+    string arrays with '' for missing values.  failed flags the runs with
+    an error.
+    '''
+
+    def __init__(self, records):
+        columns = dict((column, []) for column in COLUMNS)
+        for record in records:
+            for column in COLUMNS:
+                columns[column].append(record.get(column))
+        self.columns = {}
+        for column, values in columns.iteritems():
+            if column == 'distribution':
+                values = [json.dumps(list(value)) if value else '' for value in values]
+            if column in TEXT_COLUMNS:
+                self.columns[column] = np.array([value or '' for value in values], dtype=str)
+            else:
+                self.columns[column] = np.array([np.nan if value is None else value
+                                                 for value in values], dtype=np.float64)
+        self.failed = self.columns['error'] != ''
+
+    @classmethod
+    def from_store(cls, store, **equals):
+        '''
+        Loads the records of a ResultStore matching equals (see select)
+        '''
+        return cls(store.select(**equals))
+
+    def __len__(self):
+        return len(self.failed)
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+
+def _group_value(column, value):
+    if column in INTEGER_COLUMNS and not np.isnan(value):
+        return int(value)
+    if column in TEXT_COLUMNS:
+        return str(value) or None
+    return float(value)
+
+
+def summarise(results, groupBy=GROUP_COLUMNS, percentiles=PERCENTILES):
+    '''
+    Returns one dict per group of results (a ResultArrays) with equal
+    groupBy columns, in sorted order.  Each dict has the group columns,
+    runs, failures, and for each metric m of METRICS: m_mean, m_std,
+    m_median, m_p<q> for each percentile q and m_ci_low, m_ci_high
+    bounding the 95% confidence interval of the mean.
+    '''
+    if not len(results):
+        return []
+    keys = [results[column] for column in groupBy]
+    order = np.lexsort(keys[::-1])
+    sortedKeys = [key[order] for key in keys]
+    # a new group starts wherever any group column changes
+    change = np.zeros(len(order), dtype=bool)
+    change[0] = True
+    for key in sortedKeys:
+        change[1:] |= key[1:] != key[:-1]
+    starts = np.flatnonzero(change)
+    ends = np.append(starts[1:], len(order))
+
+    failed = results.failed[order]
+    failures = np.add.reduceat(failed.astype(np.int64), starts)
+    rows = [dict((column, _group_value(column, key[start]))
+                 for column, key in zip(groupBy, sortedKeys)) for start in starts]
+    for row, start, end, failureCount in zip(rows, starts, ends, failures):
+        row['runs'] = int(end - start)
+        row['failures'] = int(failureCount)
+
+    for metric in METRICS:
+        values = results[metric][order]
+        values = np.where(failed, np.nan, values)
+        for row, start, end in zip(rows, starts, ends):
+            group = values[start:end]
+            group = group[~np.isnan(group)]
+            count = len(group)
+            stats = dict.fromkeys(['mean', 'std', 'median', 'ci_low', 'ci_high'] +
+                                  ['p%d' % q for q in percentiles], np.nan)
+            if count:
+                mean = group.mean()
+                stats['mean'] = mean
+                stats['median'] = np.median(group)
+                for q, value in zip(percentiles, np.percentile(group, percentiles)):
+                    stats['p%d' % q] = value
+                if count > 1:
+                    std = group.std(ddof=1)
+                    half = t_95(count - 1) * std / sqrt(count)
+                    stats.update(std=std, ci_low=mean - half, ci_high=mean + half)
+            for name, value in stats.iteritems():
+                row['%s_%s' % (metric, name)] = float(value)
+    return rows
+
+
+def _csv_value(value):
+    if isinstance(value, float) and np.isnan(value):
+        return ''
+    return value
+
+
+def write_summary(rows, path):
+    '''
+    Writes summarise rows to a CSV file, one line per group
+    '''
+    if not rows:
+        fields = []
+    else:
+        fields = [column for column in COLUMNS if column in rows[0]]
+        fields += ['runs', 'failures']
+        fields += sorted(field for field in rows[0] if field not in fields)
+    with open(path, 'wb') as f:
+        writer = csv.writer(f)
+        writer.writerow(fields)
+        for row in rows:
+            writer.writerow([_csv_value(row[field]) for field in fields])
+
+
+def write_table(rows, path, parameter, metrics=METRICS, statistic='mean'):
+    '''
+    Writes a table like the *_result.csv files of data5: one line per value
+    of parameter, and for each algorithm one column per metric holding its
+    statistic, followed by its failure count.  rows are summarise rows grouped
+    by parameter and algorithm.
+    '''
+    algorithms = sorted(set(row['algorithm'] for row in rows))
+    table = {}
+    for row in rows:
+        table[(row[parameter], row['algorithm'])] = row
+    with open(path, 'wb') as f:
+        writer = csv.writer(f)
+        writer.writerow([parameter] + ['%s %s' % (algorithm, name)
+                                       for algorithm in algorithms
+                                       for name in tuple(metrics) + ('failures',)])
+        for value in sorted(set(row[parameter] for row in rows)):
+            line = [value]
+            for algorithm in algorithms:
+                row = table.get((value, algorithm))
+                for metric in metrics:
+                    line.append(_csv_value(row['%s_%s' % (metric, statistic)]) if row else '')
+                line.append(row['failures'] if row else '')
+            writer.writerow(line)
+
+
+def plot(rows, path, parameter, metric='spc'):
+    '''
+    Plots the mean of metric against parameter, one line per algorithm with
+    its 95% confidence interval as error bars, and saves it to path
+    '''
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib import pyplot
+
+    figure = pyplot.figure()
+    axes = figure.add_subplot(111)
+    for algorithm in sorted(set(row['algorithm'] for row in rows)):
+        points = sorted((row[parameter], row) for row in rows if row['algorithm'] == algorithm)
+        x = np.array([value for value, _ in points], dtype=np.float64)
+        mean = np.array([row['%s_mean' % metric] for _, row in points])
+        low = np.array([row['%s_ci_low' % metric] for _, row in points])
+        high = np.array([row['%s_ci_high' % metric] for _, row in points])
+        errors = np.nan_to_num(np.vstack([mean - low, high - mean]))
+        axes.errorbar(x, mean, yerr=errors, label=algorithm, marker='o', capsize=3)
+    axes.set_xlabel(parameter)
+    axes.set_ylabel(metric)
+    axes.legend(loc='best')
+    figure.savefig(path)
+    pyplot.close(figure)
+
+
+def report(results, parameter, prefix, plots=True):
+    '''
+    Writes prefix + '_summary.csv' (every statistic), prefix +
+    '_result.csv' (the table of means) and, with plots, prefix + '.png'
+    (spc) and prefix + '-time.png' (seconds) for results swept over
+    parameter.  Returns the summarise rows.
+    '''
+    rows = summarise(results, groupBy=(parameter, 'algorithm'))
+    write_summary(rows, prefix + '_summary.csv')
+    write_table(rows, prefix + '_result.csv', parameter)
+    if plots:
+        plot(rows, prefix + '.png', parameter, 'spc')
+        plot(rows, prefix + '-time.png', parameter, 'seconds')
+    return rows
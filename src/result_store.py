@@ -0,0 +1,230 @@
+'''
+Append-only store for experiment results, kept in one SQLite table per file.
+
+Each row is one solver run: the instance configuration (nodes, edges,
+commodities, distribution, repeat, seed), omega, algorithm, and the spc,
+iterations and seconds of the run, or the error it failed with.  Rows are
+only ever inserted.  Each insert is committed on its own, so the store also
+records which cells of a sweep are done (see experiment_runner), and any
+number of sweeps may write to the same file.
+
+Filtering and aggregation run in SQLite, which streams over the rows and
+never loads the table into memory.  import_series and import_multiple load
+the pickles that run_series and run_multiple wrote before they used a
+store.
+'''
+import json
+import os
+import pickle
+import re
+import sqlite3
+
+
+COLUMNS = ('nodes', 'edges', 'commodities', 'distribution', 'omega', 'algorithm',
+           'repeat', 'seed', 'spc', 'iterations', 'seconds', 'error', 'source')
+# columns that identify a cell of a sweep
+CELL_COLUMNS = COLUMNS[:8]
+GROUP_COLUMNS = ('nodes', 'edges', 'commodities', 'distribution', 'omega', 'algorithm')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS results (
+    nodes INTEGER, edges INTEGER, commodities INTEGER, distribution TEXT,
+    omega REAL, algorithm TEXT, repeat INTEGER, seed INTEGER,
+    spc INTEGER, iterations INTEGER, seconds REAL, error TEXT, source TEXT);
+CREATE INDEX IF NOT EXISTS results_config
+    ON results (nodes, edges, commodities, algorithm, omega);
+'''
+
+# seconds to wait for another process writing to the same store
+LOCK_TIMEOUT = 60.
+
+# file names written by epsilonSeries.py before it used a store;
+# the last number is the number of commodity groups (see
+# make_commodity_distributions)
+SERIES_NAME = re.compile(r'(?:omega|epsilon)_series_(\d+)_(\d+)_(\d+)(?:_([bkm]+))?(?:_(\d+))?\.pkl$')
+SERIES_ALGORITHMS = {None: 'vanilla', 'b': 'two_approx', 'k': 'karakosta',
+                     'bk': 'two_approx_karakosta', 'm': 'multi_route'}
+
+
+def _encode_distribution(distribution):
+    return json.dumps(list(distribution)) if distribution else None
+
+
+def _check_columns(columns):
+    for column in columns:
+        if column not in COLUMNS:
+            raise ValueError('unknown result column %r' % (column,))
+
+
+class ResultStore(object):
+    '''
+    Results in the SQLite file at path, created if it does not exist.
+    Records are dicts with (a subset of) COLUMNS as keys, distribution
+    being None or a list of group sizes.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=LOCK_TIMEOUT)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def append(self, record):
+        self.extend([record])
+
+    def extend(self, records):
+        '''
+        Inserts records and commits them in one transaction
+        '''
+        rows = []
+        for record in records:
+            row = [record.get(column) for column in COLUMNS]
+            row[3] = _encode_distribution(row[3])
+            rows.append(row)
+        with self.connection:
+            self.connection.executemany(
+                'INSERT INTO results (%s) VALUES (%s)'
+                % (', '.join(COLUMNS), ', '.join('?' * len(COLUMNS))), rows)
+
+    def _where(self, equals):
+        _check_columns(equals)
+        clauses, values = [], []
+        for column, value in sorted(equals.iteritems()):
+            if column == 'distribution':
+                value = _encode_distribution(value)
+            clauses.append('%s IS ?' % column)
+            values.append(value)
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', values
+
+    def select(self, **equals):
+        '''
+        Yields the records whose columns equal the given values, in
+        insertion order, reading them from the file as they are consumed
+        '''
+        where, values = self._where(equals)
+        for row in self.connection.execute('SELECT %s FROM results%s ORDER BY rowid'
+                                           % (', '.join(COLUMNS), where), values):
+            record = dict(zip(COLUMNS, row))
+            if record['distribution'] is not None:
+                record['distribution'] = json.loads(record['distribution'])
+            yield record
+
+    def aggregate(self, groupBy=GROUP_COLUMNS, **equals):
+        '''
+        Returns one dict per distinct value of the groupBy columns among the
+        records matching equals, with the group columns (distribution decoded
+        as in select), runs, failures (runs with an error) and the mean spc,
+        iterations and seconds of the runs that succeeded
+        '''
+        _check_columns(groupBy)
+        where, values = self._where(equals)
+        group = ', '.join(groupBy)
+        query = ('SELECT %s, COUNT(*) AS runs, SUM(error IS NOT NULL) AS failures, '
+                 'AVG(spc) AS spc, AVG(iterations) AS iterations, AVG(seconds) AS seconds '
+                 'FROM results%s GROUP BY %s ORDER BY %s' % (group, where, group, group))
+        groups = []
+        for row in self.connection.execute(query, values):
+            group = dict(zip(row.keys(), row))
+            if group.get('distribution') is not None:
+                group['distribution'] = json.loads(group['distribution'])
+            groups.append(group)
+        return groups
+
+    def recorded(self, cells):
+        '''
+        Takes cell dicts (with the CELL_COLUMNS as keys) and returns
+        {cell key: record} with the latest record of each cell already in
+        the store.  Only the configurations of the given cells are read.
+        '''
+        configs = set(cell_key(cell)[:4] for cell in cells)
+        found = {}
+        for nodes, edges, commodities, distribution in configs:
+            for record in self.select(nodes=nodes, edges=edges, commodities=commodities,
+                                      distribution=distribution):
+                found[cell_key(record)] = record
+        return found
+
+    def import_series(self, path):
+        '''
+        Loads a {omega: [(spc, iterations, seconds)]} pickle written by an
+        earlier run_series, taking the configuration from its file name.  Returns
+        the number of records added.
+        '''
+        match = SERIES_NAME.search(os.path.basename(path))
+        if match is None:
+            raise ValueError('not a series file name: %s' % path)
+        nodes, edges, commodities = (int(group) for group in match.groups()[:3])
+        algorithm = SERIES_ALGORITHMS[match.group(4)]
+        distribution = None
+        if match.group(5) == '1':
+            distribution = [commodities]
+        elif match.group(5) == '2':
+            distribution = [commodities / 2, commodities - commodities / 2]
+        elif match.group(5) is not None:
+            distribution = [1] * commodities
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        records = series_records(data, nodes=nodes, edges=edges, commodities=commodities,
+                                 distribution=distribution, algorithm=algorithm,
+                                 source=path)
+        self.extend(records)
+        return len(records)
+
+    def import_multiple(self, path, configs, omegas):
+        '''
+        Loads a [{algorithm: [(spc, iterations, seconds)]}] pickle written
+        by an earlier run_multiple, given the (nodes, edges, commodities, distribution)
+        configs and the omegas of the sweep in the order it ran them.
+        Returns the number of records added.
+        '''
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        cells = [(config, omega) for config in configs for omega in omegas]
+        records = []
+        for repeat, outData in enumerate(data):
+            for algorithm, runs in outData.iteritems():
+                for ((nodes, edges, commodities, distribution), omega), run in zip(cells, runs):
+                    records.append(_run_record(run, nodes=nodes, edges=edges,
+                                               commodities=commodities,
+                                               distribution=distribution, omega=omega,
+                                               algorithm=algorithm, repeat=repeat,
+                                               source=path))
+        self.extend(records)
+        return len(records)
+
+
+def series_records(data, **fields):
+    '''
+    Returns the records of a {omega: [(spc, iterations, seconds)]} dict as
+    pickled by earlier run_series, each with the given fields added
+    '''
+    records = []
+    for omega, runs in data.iteritems():
+        for repeat, run in enumerate(runs):
+            records.append(_run_record(run, omega=omega, repeat=repeat, **fields))
+    return records
+
+
+def _run_record(run, **record):
+    spc, iterations, seconds = run
+    if spc is None:
+        record['error'] = 'failed'
+    else:
+        record.update(spc=spc, iterations=iterations, seconds=seconds)
+    return record
+
+
+def cell_key(record):
+    '''
+    Returns the key of the cell a Task.as_dict() or result record is for
+    '''
+    distribution = record['distribution']
+    return (record['nodes'], record['edges'], record['commodities'],
+            tuple(distribution) if distribution else None, record['omega'],
+            record['algorithm'], record['repeat'], record['seed'])
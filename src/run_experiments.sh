@@ -1,15 +1,5 @@
 #! /usr/bin/zsh
 
-echo 0 | pypy experiments.py > /dev/null &
-echo 1 | pypy experiments.py > /dev/null &
-echo 2 | pypy experiments.py > /dev/null &
-echo 3 | pypy experiments.py > /dev/null &
-echo 0 | pypy experiments.py > /dev/null &
-echo 1 | pypy experiments.py > /dev/null &
-echo 2 | pypy experiments.py > /dev/null &
-echo 3 | pypy experiments.py > /dev/null &
-echo 0 | pypy experiments.py > /dev/null &
-echo 1 | pypy experiments.py > /dev/null &
-echo 2 | pypy experiments.py > /dev/null &
-echo 3 | pypy experiments.py > /dev/null &
-
+# every preset with 30 repeats, one preset at a time on a pool of one
+# worker per core
+pypy experiments_argv.py --repeats 30 0 1 2 3 > /dev/null
@@ -0,0 +1,102 @@
+'''
+Zero-copy transport of a solver instance between processes.
+
+export_graph writes the CSR topology, capacities and commodity metadata of an
+instance to a flat binary file.  attach_graph maps that file copy-on-write
+and wraps each section in a ctypes array view, so every process solving on
+the same topology shares one copy of it in the page cache; only the length
+and flow vectors of each attached graph are private.
+
+File layout (little endian, every section 8 byte aligned):
+    header   magic, then int64 n, m, k, size of the pickled node labels
+    int64    offsets[n + 1], heads[m], tails[m], edge_ids[m]
+    float64  capacity[m]
+    int64    sources[k], sinks[k]
+    float64  demands[k]
+    bytes    pickled list of node labels
+'''
+import ctypes
+import mmap
+import pickle
+import struct
+
+from commodity_stream import CommodityArrays
+from csr_graph import CSRGraph
+
+
+MAGIC = 'MCFCSR01'
+HEADER = struct.Struct('<8sqqqq')
+
+
+def _write_section(out, ctype, values):
+    section = (ctype * len(values))(*values)
+    out.write(buffer(section))
+
+
+def export_graph(path, graph, commodities=()):
+    '''
+    Writes graph and the source, sink and demand of each commodity to path.
+    commodities may also be a CommodityArrays over graph.
+    '''
+    node_index = graph.node_index
+    if isinstance(commodities, CommodityArrays):
+        sources, sinks, demands = (commodities.sources, commodities.sinks,
+                                   commodities.demands)
+    else:
+        sources = [node_index[commodity.source] for commodity in commodities]
+        sinks = [node_index[commodity.sink] for commodity in commodities]
+        demands = [commodity.demand for commodity in commodities]
+    labels = pickle.dumps(graph.nodes, pickle.HIGHEST_PROTOCOL)
+    with open(path, 'wb') as out:
+        out.write(HEADER.pack(MAGIC, graph.num_nodes, graph.num_edges,
+                              len(demands), len(labels)))
+        for section in (graph.offsets, graph.heads, graph.tails, graph.edge_ids):
+            _write_section(out, ctypes.c_int64, section)
+        _write_section(out, ctypes.c_double, graph.capacity)
+        _write_section(out, ctypes.c_int64, sources)
+        _write_section(out, ctypes.c_int64, sinks)
+        _write_section(out, ctypes.c_double, demands)
+        out.write(labels)
+
+
+def attach_graph(path, commodity_class=None):
+    '''
+    Maps an exported instance and returns (graph, commodities).
+
+    The graph's topology and capacity arrays are views into the mapping.  If
+    commodity_class is given, commodities is a list of
+    commodity_class(source, sink, demand); otherwise it is a CommodityArrays
+    over the graph whose sources, sinks and demands are views as well, which
+    maximum_concurrent_flow takes as it is.
+    '''
+    with open(path, 'rb') as source_file:
+        mapping = mmap.mmap(source_file.fileno(), 0, access=mmap.ACCESS_COPY)
+    magic, n, m, k, labels_size = HEADER.unpack_from(mapping, 0)
+    if magic != MAGIC:
+        raise ValueError('%s is not an exported graph' % path)
+
+    offset = [HEADER.size]
+
+    def view(ctype, count):
+        section = (ctype * count).from_buffer(mapping, offset[0])
+        offset[0] += ctypes.sizeof(section)
+        return section
+
+    offsets = view(ctypes.c_int64, n + 1)
+    heads = view(ctypes.c_int64, m)
+    tails = view(ctypes.c_int64, m)
+    edge_ids = view(ctypes.c_int64, m)
+    capacity = view(ctypes.c_double, m)
+    sources = view(ctypes.c_int64, k)
+    sinks = view(ctypes.c_int64, k)
+    demands = view(ctypes.c_double, k)
+    nodes = pickle.loads(mapping[offset[0]:offset[0] + labels_size])
+
+    graph = CSRGraph.from_arrays(nodes, offsets, heads, tails, edge_ids, capacity)
+    graph.mapping = mapping  # keeps the views valid
+
+    if commodity_class is None:
+        return graph, CommodityArrays.from_arrays(graph, sources, sinks, demands)
+    commodities = [commodity_class(nodes[sources[idx]], nodes[sinks[idx]], demands[idx])
+                   for idx in xrange(k)]
+    return graph, commodities
@@ -0,0 +1,43 @@
+from experiment_runner import make_tasks
+from experiment_runner import run_tasks
+from result_store import ResultStore
+
+''' Tests that a sweep recorded in a ResultStore resumes instead of
+    running again.
+'''
+
+
+def small_sweep():
+    return make_tasks([(10, 30, 2, None), (10, 30, 2, [1, 1])], [0.5, 0.3],
+                      ['vanilla', 'karakosta'], repeats=2, seed=1, instances=None)
+
+
+def test_second_pass_runs_nothing():
+    store = ResultStore(':memory:')
+    first = run_tasks(small_sweep(), store, processes=1)
+    assert len(store) == len(first) == 16
+    second = run_tasks(small_sweep(), store, processes=1)
+    assert len(store) == 16, 'the second pass ran %d tasks' % (len(store) - 16)
+    assert [result['spc'] for result in second] == [result['spc'] for result in first]
+
+
+def test_retry_failed():
+    store = ResultStore(':memory:')
+    first = run_tasks(small_sweep(), store, processes=1)
+    failed = dict(first[3], spc=None, iterations=None, seconds=None, error='MemoryError()')
+    store.append(failed)
+    resumed = run_tasks(small_sweep(), store, processes=1)
+    assert len(store) == 17
+    assert resumed[3]['error'] == 'MemoryError()'
+    retried = run_tasks(small_sweep(), store, processes=1, retry_failed=True)
+    assert len(store) == 18
+    assert retried[3]['error'] is None and retried[3]['spc'] == first[3]['spc']
+    # the retried cell is recorded as succeeded now
+    run_tasks(small_sweep(), store, processes=1, retry_failed=True)
+    assert len(store) == 18
+
+
+if __name__ == '__main__':
+    test_second_pass_runs_nothing()
+    test_retry_failed()
+    print "sweeps resume from their store"
@@ -0,0 +1,92 @@
+from max_concurrent_flow import Commodity
+from max_concurrent_flow import Edge
+from max_concurrent_flow import maximum_concurrent_flow
+from random_instances import prepare_random_input
+
+''' Tests of maximum_concurrent_flow options against plain runs on random
+    instances.
+'''
+
+
+def test_lazy_paths_fewer_shortest_paths():
+    # big enough for paths to be reused across augmentations; on tiny
+    # instances the smaller epsilon of lazy_paths can cost more than it saves
+    edges, commodities = prepare_random_input(30, 120, 6, seed=3)
+    exact = maximum_concurrent_flow(edges, commodities, error=1.)
+    lazy = maximum_concurrent_flow(edges, commodities, error=1., lazy_paths=True)
+    assert lazy.shortestPathComputations < 0.75 * exact.shortestPathComputations, \
+        'lazy %d, exact %d' % (lazy.shortestPathComputations, exact.shortestPathComputations)
+    assert lazy.lambda_ >= exact.lambda_ / 2
+
+
+def test_lazy_paths_only_with_plain_phases():
+    edges, commodities = two_sink_instance()
+    for option in ('karakosta', 'packing', 'multi_route'):
+        try:
+            maximum_concurrent_flow(edges, commodities, lazy_paths=True, **{option: True})
+        except ValueError:
+            continue
+        assert False, 'lazy_paths with %s did not raise' % option
+
+
+def two_sink_instance():
+    # TestCase2 of test.py; nothing leaves the sinks 3 and 6, so the flow
+    # into each is the flow routed for its commodity.  With demands (10, 10)
+    # the optimum lambda is 0.4, bounded by the edge into 3.
+    edges = [Edge('S', '1', 4), Edge('S', '4', 5), Edge('4', '1', 1), Edge('1', '2', 5),
+             Edge('4', '5', 3), Edge('2', '5', 2), Edge('2', '3', 4), Edge('5', '6', 5)]
+    return edges, [Commodity('S', '3', 10), Commodity('S', '6', 10)]
+
+
+def test_throughput_relative_to_given_demands():
+    edges, commodities = two_sink_instance()
+    for options in ({}, {'karakosta': True}, {'packing': True}, {'gap_check': 10}):
+        result = maximum_concurrent_flow(edges, commodities, error=0.05, **options)
+        inflow = dict.fromkeys(('3', '6'), 0.)
+        for edge, flow in zip(edges, result.flow):
+            if edge.tail in inflow:
+                inflow[edge.tail] += flow
+        for commodity, throughput in zip(commodities, result.throughput):
+            routed = inflow[commodity.sink]
+            assert abs(throughput * commodity.demand - routed) <= 1e-9 * routed, \
+                '%s: throughput %r, routed %r' % (options, throughput, routed)
+        assert 0.4 / 1.05 <= result.lambda_ <= 0.4 + 1e-9, (options, result.lambda_)
+        assert [commodity.demand for commodity in commodities] == [10, 10]
+
+
+def test_warm_start_against_cold():
+    edges, commodities = two_sink_instance()
+    coarse = maximum_concurrent_flow(edges, commodities, error=0.2, returnState=True)
+    # a tighter error, then other demands (optimum 0.5), from the coarse run
+    for demands, optimum in (((10, 10), 0.4), ((1, 10), 0.5)):
+        for commodity, demand in zip(commodities, demands):
+            commodity.demand = demand
+        cold = maximum_concurrent_flow(edges, commodities, error=0.05)
+        warm = maximum_concurrent_flow(edges, commodities, error=0.05, state=coarse.state)
+        for result in (cold, warm):
+            assert optimum / 1.05 <= result.lambda_ <= optimum + 1e-9, \
+                (demands, result.lambda_)
+        # the warm count includes the coarse run's
+        assert coarse.shortestPathComputations < warm.shortestPathComputations
+        assert warm.shortestPathComputations < cold.shortestPathComputations / 2, \
+            'warm %d, cold %d' % (warm.shortestPathComputations,
+                                  cold.shortestPathComputations)
+
+
+def test_resume_finished_run():
+    edges, commodities = two_sink_instance()
+    first = maximum_concurrent_flow(edges, commodities, error=0.2, returnState=True)
+    resumed = maximum_concurrent_flow(edges, commodities, error=0.2, state=first.state)
+    assert resumed.phases == first.phases
+    assert resumed.shortestPathComputations == first.shortestPathComputations
+    # same flows, scaled by their max congestion instead of the log bound
+    assert first.lambda_ - 1e-9 <= resumed.lambda_ <= 0.4 + 1e-9
+
+
+if __name__ == '__main__':
+    test_lazy_paths_fewer_shortest_paths()
+    test_lazy_paths_only_with_plain_phases()
+    test_throughput_relative_to_given_demands()
+    test_warm_start_against_cold()
+    test_resume_finished_run()
+    print "maximum_concurrent_flow options behave"
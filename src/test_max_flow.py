@@ -0,0 +1,73 @@
+import random
+
+import networkx as nx
+from csr_graph import CSRGraph
+from max_concurrent_flow import Commodity
+from max_concurrent_flow import Edge
+from max_concurrent_flow import calculate_z
+
+''' Regression test of calculate_z (min_demand_ratio over Dinic max flows)
+    against networkx max flow on seeded random instances.
+'''
+
+
+def random_instance(seed, numNodes, numEdges, distribution):
+    ''' Returns (edges, commodities) of a random digraph with
+        distribution[i] commodities from the i-th source, each to a node
+        reachable from it, or (None, None) if there are not enough sources
+        that reach that many nodes
+    '''
+    rng = random.Random(seed)
+    graph = nx.gnm_random_graph(numNodes, numEdges, seed=seed, directed=True)
+    edges = [Edge(head, tail, rng.randint(2, 10)) for head, tail in graph.edges()]
+    sources = sorted(graph.nodes())
+    rng.shuffle(sources)
+    sources = iter(sources)
+    commodities = []
+    for count in distribution:
+        for source in sources:
+            sinks = sorted(nx.descendants(graph, source))
+            if len(sinks) >= count:
+                break
+        else:
+            return None, None
+        commodities.extend(Commodity(source, sink, rng.randint(1, 50))
+                           for sink in rng.sample(sinks, count))
+    return edges, commodities
+
+
+def networkx_z(edges, commodities):
+    G = nx.DiGraph()
+    for edge in edges:
+        if G.has_edge(edge.head, edge.tail):
+            G[edge.head][edge.tail]['capacity'] += edge.capacity
+        else:
+            G.add_edge(edge.head, edge.tail, capacity=edge.capacity)
+    return min(nx.max_flow(G, commodity.source, commodity.sink, capacity='capacity')
+               / float(commodity.demand) for commodity in commodities)
+
+
+def check_z(seeds, numNodes, numEdges, numCommodities, distribution=None):
+    for seed in seeds:
+        edges, commodities = random_instance(seed, numNodes, numEdges,
+                                             distribution or [1] * numCommodities)
+        if edges is None:
+            continue
+        z = calculate_z(CSRGraph(edges), commodities)
+        expected = networkx_z(edges, commodities)
+        assert abs(z - expected) <= 1e-9 * max(1., expected), \
+            'seed %d: z %r, networkx %r' % (seed, z, expected)
+
+
+def test_z_shared_sources():
+    check_z(range(100), 30, 90, 6, [2,2,1,1])
+
+
+def test_z_distinct_sources():
+    check_z(range(100, 120), 50, 200, 10)
+
+
+if __name__ == '__main__':
+    test_z_shared_sources()
+    test_z_distinct_sources()
+    print "calculate_z matches networkx"
@@ -0,0 +1,81 @@
+import random
+
+import networkx as nx
+from csr_graph import CSRGraph
+from max_concurrent_flow import Edge
+from path_enumeration import BoundedPathEnumerator
+
+''' Regression test of BoundedPathEnumerator against brute force
+    enumeration of all simple paths on seeded random multigraphs.
+'''
+
+
+def random_graph(seed, numNodes, numEdges):
+    ''' Returns a CSRGraph of a random digraph with some edges doubled and
+        random lengths
+    '''
+    rng = random.Random(seed)
+    graph = nx.gnm_random_graph(numNodes, numEdges, seed=seed, directed=True)
+    edges = [Edge(head, tail, 1) for head, tail in graph.edges()]
+    edges += [Edge(edge.head, edge.tail, 1) for edge in rng.sample(edges, numEdges / 5)]
+    graph = CSRGraph(edges)
+    for eid in xrange(graph.num_edges):
+        graph.length[eid] = rng.uniform(0.1, 1.)
+    return graph
+
+
+def all_simple_paths(graph, source, sink):
+    ''' Returns the edge ids of every simple path from source to sink '''
+    paths = []
+    stack = [(source, [], set([source]))]
+    while stack:
+        u, path, visited = stack.pop()
+        if u == sink:
+            paths.append(path)
+            continue
+        for eid in xrange(graph.offsets[u], graph.offsets[u + 1]):
+            v = graph.tails[eid]
+            if v not in visited:
+                stack.append((v, path + [eid], visited | set([v])))
+    return paths
+
+
+def check_paths(seeds, numNodes, numEdges, pairs=5):
+    for seed in seeds:
+        graph = random_graph(seed, numNodes, numEdges)
+        enumerator = BoundedPathEnumerator(graph)
+        rng = random.Random(seed)
+        for _ in xrange(pairs):
+            source, sink = rng.sample(xrange(graph.num_nodes), 2)
+            paths = all_simple_paths(graph, source, sink)
+            lengths = sorted(set(sum(graph.length[eid] for eid in path) for path in paths))
+            # bounds halfway between path lengths, so rounding cannot decide
+            bounds = [0.]
+            if lengths:
+                bounds += [(a + b) / 2 for a, b in zip(lengths, lengths[1:])][::3]
+                bounds.append(lengths[-1] + 1.)
+            for bound in bounds:
+                expected = set(tuple(path) for path in paths
+                               if sum(graph.length[eid] for eid in path) <= bound)
+                found = [tuple(path) for path in enumerator.paths(source, sink, bound)]
+                assert len(found) == len(set(found)), 'seed %d: repeated path' % seed
+                assert set(found) == expected, \
+                    'seed %d, %d -> %d within %r: %d paths, expected %d' % (
+                        seed, source, sink, bound, len(found), len(expected))
+                found_lengths = [sum(graph.length[eid] for eid in path) for path in found]
+                assert all(a <= b + 1e-12 for a, b in zip(found_lengths, found_lengths[1:])), \
+                    'seed %d: paths out of order' % seed
+
+
+def test_paths_sparse():
+    check_paths(range(30), 8, 16)
+
+
+def test_paths_dense():
+    check_paths(range(30, 40), 7, 22)
+
+
+if __name__ == '__main__':
+    test_paths_sparse()
+    test_paths_dense()
+    print "BoundedPathEnumerator matches brute force"
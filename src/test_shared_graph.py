@@ -0,0 +1,33 @@
+import os
+import shutil
+import tempfile
+
+from csr_graph import CSRGraph
+from max_concurrent_flow import maximum_concurrent_flow
+from random_instances import prepare_random_input
+from shared_graph import attach_graph
+from shared_graph import export_graph
+
+''' Tests that an exported instance solves the same once attached.
+'''
+
+
+def test_attached_commodities_solve():
+    edges, commodities = prepare_random_input(20, 60, 4, seed=5)
+    expected = maximum_concurrent_flow(edges, commodities, error=0.5)
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'instance.mcf')
+        export_graph(path, CSRGraph(edges), commodities)
+        graph, attached = attach_graph(path)
+        result = maximum_concurrent_flow(graph, attached, error=0.5)
+    finally:
+        shutil.rmtree(directory)
+    assert len(attached) == len(commodities)
+    assert result.lambda_ == expected.lambda_
+    assert result.shortestPathComputations == expected.shortestPathComputations
+
+
+if __name__ == '__main__':
+    test_attached_commodities_solve()
+    print "attached instances solve like the originals"
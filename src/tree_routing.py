@@ -0,0 +1,91 @@
+'''
+Source tree routing for the grouped (Karakostas style) Garg-Konemann phases.
+All commodities that share a source are routed together along one shortest
+path tree, and the tree is only rebuilt when a length update breaks it.
+'''
+from array import array
+
+
+class SourceTreeRouter(object):
+    '''
+    Routes the demands of one source along the shortest path tree held by a
+    DijkstraEngine.
+
+    Each step pushes the remaining demand of every sink up the tree to get
+    the load on each tree edge, scales the step so no edge carries more than
+    its capacity, and applies the flow and length update for all sinks in a
+    single batch.  A source with a single sink has no tree to share, so it
+    is routed along its shortest path as in the karakosta phases.
+    '''
+
+    def __init__(self, engine):
+        n = engine.graph.num_nodes
+        self.engine = engine
+        self.graph = engine.graph
+        self.pending = array('d', [0.]) * n  # demand waiting at each node
+
+    def route(self, source, sinks, demands, epsilon, margin, flows=None):
+        '''
+        Routes demands[i] from node index source to node index sinks[i].
+        Stops once every remaining demand is at most margin.  If flows is
+        given, flows[i] is increased by the amount routed to sinks[i].
+
+        Returns the number of shortest path trees that had to be built.
+        '''
+        if len(sinks) == 1:
+            return self.route_path(source, sinks[0], demands[0], epsilon, flows)
+        engine, graph, pending = self.engine, self.graph, self.pending
+        heads = graph.heads
+        remaining = list(demands)
+
+        engine.run(source)
+        trees = 1
+        while True:
+            for idx, sink in enumerate(sinks):
+                if not engine.settled(sink):
+                    engine.path(sink)  # raises NetworkXNoPath
+                pending[sink] += remaining[idx]
+
+            # push pending demand towards the source in reverse settle order
+            pred, order = engine.pred, engine.order
+            eids, loads = [], []
+            for idx in xrange(engine.num_settled - 1, 0, -1):
+                v = order[idx]
+                load = pending[v]
+                if load:
+                    pending[v] = 0.
+                    eid = pred[v]
+                    pending[heads[eid]] += load
+                    eids.append(eid)
+                    loads.append(load)
+            pending[source] = 0.
+
+            scale = graph.bottleneck_scale(eids, loads)
+            graph.route(eids, [scale * load for load in loads], epsilon)
+            if flows is not None:
+                for idx, demand in enumerate(remaining):
+                    flows[idx] += scale * demand
+
+            remaining = [demand * (1 - scale) for demand in remaining]
+            if scale >= 1 or max(remaining) <= margin:
+                return trees
+            if not engine.revalidate():
+                engine.run(source)
+                trees += 1
+
+    def route_path(self, source, sink, demand, epsilon, flows=None):
+        '''
+        Routes demand from source to sink along one shortest path, in steps
+        of its bottleneck capacity, skipping the tree pushes and revalidation
+        of route.  Returns the number of shortest path computations, 1.
+        '''
+        graph = self.graph
+        path = self.engine.shortest_path(source, sink)
+        min_cap = graph.min_capacity(path)
+        while demand > 0:
+            added_flow = min(min_cap, demand)
+            demand -= added_flow
+            if flows is not None:
+                flows[0] += added_flow
+            graph.augment(path, added_flow, epsilon)
+        return 1